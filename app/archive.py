@@ -0,0 +1,122 @@
+"""Streaming ZIP export of transcripts together with their audio.
+
+The archive is produced piece by piece while it is sent, so exports of many
+gigabytes of audio need neither a temporary file nor memory beyond one block.
+"""
+import os
+import re
+import zipfile
+from typing import Iterator
+
+from sqlalchemy import LargeBinary, type_coerce
+
+from .compression import iter_decompressed
+from .db import SessionLocal, Transcript, Recording, RecordingChunk
+from .segments import load_segments, to_srt
+from .storage import media_file
+
+_COPY_BYTES = 1024 * 1024
+
+
+class _Sink:
+    """Write-only file for ZipFile that buffers output until it is drained.
+
+    Having no ``seek`` makes ZipFile write data descriptors instead of
+    going back to patch entry headers.
+    """
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _folder(transcript_id: int, filename: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.splitext(filename)[0]) or "transcript"
+    return f"{transcript_id}-{name}"
+
+
+def _audio_files(db, row) -> list[tuple[str, str]]:
+    """``(path in archive, path on disk)`` for the media of one transcript."""
+    folder = _folder(row.id, row.filename)
+    path = media_file(row.content_hash, row.media_path)
+    if path:
+        return [(f"{folder}/{row.filename}", path)]
+    chunks = (
+        db.query(RecordingChunk.seq, RecordingChunk.path)
+        .join(Recording, Recording.id == RecordingChunk.recording_id)
+        .filter(Recording.transcript_id == row.id)
+        .order_by(RecordingChunk.seq)
+        .all()
+    )
+    # Live recordings keep one self-contained file per chunk, as the browser sent them.
+    return [
+        (f"{folder}/audio/chunk-{chunk.seq:05d}.webm", chunk.path)
+        for chunk in chunks
+        if os.path.exists(chunk.path)
+    ]
+
+
+def stream_archive(transcript_ids: list[int]) -> Iterator[bytes]:
+    """Yield a ZIP with the text, subtitles, summary and audio of each transcript.
+
+    Opens its own session because the response is streamed after the request's
+    session has been closed.
+    """
+    db = SessionLocal()
+    sink = _Sink()
+    try:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for transcript_id in transcript_ids:
+                row = (
+                    db.query(
+                        Transcript.id,
+                        Transcript.filename,
+                        Transcript.content_hash,
+                        Transcript.media_path,
+                        type_coerce(Transcript.result, LargeBinary).label("result"),
+                        type_coerce(Transcript.summary, LargeBinary).label("summary"),
+                    )
+                    .filter(Transcript.id == transcript_id)
+                    .first()
+                )
+                if not row:
+                    continue
+                folder = _folder(row.id, row.filename)
+                for name, stored in (("transcript.txt", row.result), ("summary.txt", row.summary)):
+                    if stored is None:
+                        continue
+                    with archive.open(f"{folder}/{name}", "w") as entry:
+                        for chunk in iter_decompressed(stored):
+                            entry.write(chunk)
+                            yield sink.drain()
+                segments = load_segments(db, row.id)
+                if segments:
+                    archive.writestr(f"{folder}/transcript.srt", to_srt(segments))
+                    yield sink.drain()
+                for arcname, path in _audio_files(db, row):
+                    info = zipfile.ZipInfo.from_file(path, arcname)
+                    # Audio is already compressed; deflating it again only costs CPU.
+                    info.compress_type = zipfile.ZIP_STORED
+                    with open(path, "rb") as src, archive.open(info, "w") as entry:
+                        while True:
+                            block = src.read(_COPY_BYTES)
+                            if not block:
+                                break
+                            entry.write(block)
+                            yield sink.drain()
+                # Nothing from this transcript is needed again.
+                db.expunge_all()
+        yield sink.drain()
+    finally:
+        db.close()
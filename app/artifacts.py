@@ -0,0 +1,128 @@
+"""On-disk artifacts of the transcription stages, for cheap re-runs.
+
+Each stage's output is stored under the media's content hash and a key
+derived from the parameters that produced it: decoded audio, raw ASR
+segments, aligned words and diarization turns. A later run with the same
+media reuses every stage whose parameters are unchanged, so adding a
+Hugging Face token only runs diarization, and a crash during diarization
+keeps the finished ASR pass.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+from typing import Any
+
+import numpy as np
+
+from .audio import SAMPLE_RATE, save_pcm, load_pcm
+from .compression import compress, decompress
+from .storage import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR = os.path.join(UPLOAD_DIR, "artifacts")
+ENABLED = os.getenv("ARTIFACTS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Least recently used media's artifacts are removed beyond this size.
+MAX_BYTES = int(float(os.getenv("ARTIFACTS_MAX_GB", "20")) * 1024**3)
+# Bump to invalidate artifacts written by older code.
+FORMAT_VERSION = 1
+
+
+def stage_key(**params: Any) -> str:
+    """Short stable digest of a stage's parameters (including upstream keys)."""
+    encoded = json.dumps({"v": FORMAT_VERSION, **params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+AUDIO_KEY = stage_key(stage="audio", rate=SAMPLE_RATE)
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as fh:
+        fh.write(data)
+
+
+class ArtifactStore:
+    """Artifacts of one media file. Without a content hash nothing is stored."""
+
+    def __init__(self, content_hash: str | None) -> None:
+        self.dir = (
+            os.path.join(ARTIFACTS_DIR, content_hash[:2], content_hash)
+            if ENABLED and content_hash
+            else None
+        )
+
+    def _path(self, stage: str, key: str, ext: str) -> str:
+        return os.path.join(self.dir, f"{stage}-{key}{ext}")
+
+    def _hit(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        # The directory's mtime marks when this media was last used, for pruning.
+        os.utime(self.dir)
+        return True
+
+    def _write(self, path: str, write) -> None:
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = f"{path}.tmp"
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except OSError:
+            # A full disk must not fail the transcription itself.
+            logger.exception("Could not save artifact %s", path)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def load(self, stage: str, key: str) -> Any | None:
+        if self.dir is None:
+            return None
+        path = self._path(stage, key, ".json")
+        if not self._hit(path):
+            return None
+        with open(path, "rb") as fh:
+            return json.loads(decompress(fh.read()))
+
+    def save(self, stage: str, key: str, value: Any) -> None:
+        if self.dir is None:
+            return
+        # Model outputs may hold numpy scalars.
+        data = compress(json.dumps(value, separators=(",", ":"), default=float))
+        self._write(self._path(stage, key, ".json"), lambda tmp: _write_bytes(tmp, data))
+
+    def load_audio(self, key: str, temp_dir: str | None = None) -> np.ndarray | None:
+        if self.dir is None:
+            return None
+        path = self._path("audio", key, ".npy")
+        if not self._hit(path):
+            return None
+        return load_pcm(path, temp_dir)
+
+    def save_audio(self, key: str, audio: np.ndarray) -> None:
+        if self.dir is None:
+            return
+        self._write(self._path("audio", key, ".npy"), lambda tmp: save_pcm(tmp, audio))
+        prune()
+
+
+def prune(max_bytes: int = MAX_BYTES) -> None:
+    """Delete the artifacts of the least recently used media until under ``max_bytes``."""
+    if not os.path.isdir(ARTIFACTS_DIR):
+        return
+    entries = []
+    total = 0
+    for prefix in os.scandir(ARTIFACTS_DIR):
+        if not prefix.is_dir():
+            continue
+        for media in os.scandir(prefix.path):
+            size = sum(f.stat().st_size for f in os.scandir(media.path) if f.is_file())
+            entries.append((media.stat().st_mtime, size, media.path))
+            total += size
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        logger.info("Pruned artifacts %s", os.path.basename(path))
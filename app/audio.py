@@ -0,0 +1,141 @@
+import os
+import logging
+import threading
+import subprocess
+from typing import Iterator
+
+import numpy as np
+
+from .storage import probe_duration
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# Recordings longer than this are decoded into a memory-mapped file instead of RAM.
+MMAP_SECONDS = int(os.getenv("AUDIO_MMAP_SECONDS", "3600"))
+_READ_BYTES = SAMPLE_RATE * 2 * 10  # ten seconds of s16le mono per read
+
+
+def _allocate(samples: int, mmap_path: str | None) -> np.ndarray:
+    if mmap_path:
+        return np.memmap(mmap_path, dtype=np.float32, mode="w+", shape=(samples,))
+    return np.empty(samples, dtype=np.float32)
+
+
+def _grow(buffer: np.ndarray, filled: int, samples: int, mmap_path: str | None) -> np.ndarray:
+    if mmap_path:
+        buffer.flush()
+        del buffer
+        # Extend the backing file in place and remap it.
+        with open(mmap_path, "r+b") as fh:
+            fh.truncate(samples * 4)
+        return np.memmap(mmap_path, dtype=np.float32, mode="r+", shape=(samples,))
+    grown = np.empty(samples, dtype=np.float32)
+    grown[:filled] = buffer[:filled]
+    return grown
+
+
+def _feed(stdin, source: Iterator[bytes], errors: list) -> None:
+    try:
+        for block in source:
+            stdin.write(block)
+    except BrokenPipeError:
+        pass  # ffmpeg exited; its own error is reported
+    except Exception as exc:
+        errors.append(exc)
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def decode_audio(path: str, temp_dir: str | None = None, source: Iterator[bytes] | None = None) -> np.ndarray:
+    """Stream ``path`` through ffmpeg into a 16 kHz mono float32 array.
+
+    The samples are written straight into a preallocated buffer sized from
+    ffprobe, so the file is decoded once and no intermediate WAV is written.
+    Long recordings are backed by a memory-mapped file inside ``temp_dir``.
+    With ``source``, the media is read from that iterator instead of
+    ``path``, so a file can be decoded while it is still arriving.
+    """
+    duration = probe_duration(path) if source is None else None
+    capacity = int((duration + 1) * SAMPLE_RATE) if duration else SAMPLE_RATE * 600
+    # A stream's length is unknown until it ends, so it is treated as long.
+    is_long = duration > MMAP_SECONDS if duration else source is not None
+    mmap_path = None
+    if temp_dir and is_long:
+        mmap_path = os.path.join(temp_dir, "audio.f32")
+    buffer = _allocate(capacity, mmap_path)
+
+    cmd = ["ffmpeg", "-v", "error", "-threads", "0"]
+    cmd += ["-nostdin", "-i", path] if source is None else ["-i", "pipe:0"]
+    cmd += ["-vn", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if source is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    feed_errors: list[Exception] = []
+    feeder = None
+    if source is not None:
+        feeder = threading.Thread(target=_feed, args=(proc.stdin, source, feed_errors), daemon=True)
+        feeder.start()
+    filled = 0
+    leftover = b""
+    try:
+        while True:
+            chunk = proc.stdout.read(_READ_BYTES)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            usable = len(chunk) - len(chunk) % 2
+            leftover = chunk[usable:]
+            samples = np.frombuffer(chunk[:usable], dtype=np.int16)
+            end = filled + len(samples)
+            if end > len(buffer):
+                buffer = _grow(buffer, filled, max(end, len(buffer) * 2), mmap_path)
+            np.multiply(samples, 1 / 32768.0, out=buffer[filled:end], casting="unsafe")
+            filled = end
+        stderr = proc.stderr.read().decode(errors="replace")
+        if feeder:
+            feeder.join()
+        if feed_errors:
+            raise feed_errors[0]
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {os.path.basename(path)}: {stderr.strip()}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    logger.info("Decoded %s: %.1fs of audio", os.path.basename(path), filled / SAMPLE_RATE)
+    return buffer[:filled]
+
+
+def save_pcm(path: str, audio: np.ndarray) -> None:
+    """Write decoded audio to ``path`` as 16-bit PCM in ``.npy`` format.
+
+    The samples came from 16-bit PCM, so this is lossless at half the size.
+    """
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.int16, shape=(len(audio),))
+    block = _READ_BYTES * 64
+    for lo in range(0, len(audio), block):
+        chunk = np.rint(np.asarray(audio[lo:lo + block]) * 32768.0)
+        out[lo:lo + len(chunk)] = np.clip(chunk, -32768, 32767)
+    out.flush()
+    del out
+
+
+def load_pcm(path: str, temp_dir: str | None = None) -> np.ndarray:
+    """Read audio written by ``save_pcm``, memory-mapped like ``decode_audio`` when long."""
+    pcm = np.load(path, mmap_mode="r")
+    mmap_path = None
+    if temp_dir and len(pcm) > MMAP_SECONDS * SAMPLE_RATE:
+        mmap_path = os.path.join(temp_dir, "audio.f32")
+    buffer = _allocate(len(pcm), mmap_path)
+    block = _READ_BYTES * 64
+    for lo in range(0, len(pcm), block):
+        np.multiply(pcm[lo:lo + block], 1 / 32768.0, out=buffer[lo:lo + block], casting="unsafe")
+    return buffer
@@ -0,0 +1,153 @@
+"""Benchmark ASR runtime settings on this machine and save the fastest.
+
+    python -m app.autotune --audio sample.wav
+    python -m app.autotune --audio sample.wav --compute-types int8,float32 --threads 4,8 --batch-sizes 4,8,16
+
+Use a recording with real speech; silence and tones are skipped by the VAD and
+make every candidate look equally fast. Each candidate runs in a fresh process,
+so its peak memory is measured on its own and no model stays loaded between
+runs. Candidates whose peak memory exceeds the budget are discarded and the
+fastest remaining one is saved to ``RUNTIME_PROFILE``; workers use it from
+their next start.
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+
+import numpy as np
+
+from .audio import decode_audio, SAMPLE_RATE
+from .runtime import PROFILE, PROFILE_PATH, RuntimeProfile, save_profile, ENV_VARS
+
+
+def _available_mb() -> int | None:
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _measure(profile: RuntimeProfile, audio: np.ndarray, repeat: int) -> dict:
+    """Time ``profile`` on ``audio``; runs in a child process."""
+    from .models import get_asr_model
+
+    started = time.perf_counter()
+    model = get_asr_model(profile.model_size, profile.compute_type, threads=profile.threads)
+    load_seconds = time.perf_counter() - started
+    # The first call pays one-off initialisation; keep it out of the timings.
+    model.transcribe(audio[: SAMPLE_RATE * 10], batch_size=profile.batch_size)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        model.transcribe(audio, batch_size=profile.batch_size)
+        timings.append(time.perf_counter() - started)
+    seconds = statistics.median(timings)
+    return {
+        "load_seconds": round(load_seconds, 2),
+        "seconds": round(seconds, 3),
+        "real_time_factor": round(seconds / (len(audio) / SAMPLE_RATE), 4),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    }
+
+
+def candidates(sizes: list[str], compute_types: list[str], threads: list[int], batch_sizes: list[int]):
+    for size in sizes:
+        for compute_type in compute_types:
+            for n in threads:
+                for batch_size in batch_sizes:
+                    yield RuntimeProfile(size, compute_type, n, batch_size)
+
+
+def _ints(value: str) -> list[int]:
+    return sorted({int(v) for v in value.split(",") if v})
+
+
+def main(argv: list[str] | None = None) -> int:
+    cpus = os.cpu_count() or 1
+    budget = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "6144"))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--audio", required=True, help="speech recording to benchmark on")
+    parser.add_argument("--seconds", type=int, default=120, help="use at most this much of the recording")
+    parser.add_argument("--sizes", default=PROFILE.model_size, help="comma separated model sizes")
+    parser.add_argument("--compute-types", default="int8,float32")
+    parser.add_argument("--threads", default=",".join(str(n) for n in {cpus, max(1, cpus // 2), max(1, cpus // 4)}))
+    parser.add_argument("--batch-sizes", default="4,8,16")
+    parser.add_argument("--repeat", type=int, default=2, help="timed runs per candidate; the median counts")
+    parser.add_argument("--memory-mb", type=int, default=budget, help="peak memory a profile may use")
+    parser.add_argument("--out", default=PROFILE_PATH, help="where to save the winning profile")
+    parser.add_argument("--dry-run", action="store_true", help="report results without saving")
+    args = parser.parse_args(argv)
+
+    limit = args.memory_mb
+    available = _available_mb()
+    if available is not None and available < limit:
+        print(f"Only {available} MB available; limiting profiles to that", file=sys.stderr)
+        limit = available
+
+    audio = np.ascontiguousarray(decode_audio(args.audio)[: args.seconds * SAMPLE_RATE])
+    if not len(audio):
+        parser.error(f"{args.audio} contains no audio")
+
+    results = []
+    for profile in candidates(
+        [s for s in args.sizes.split(",") if s],
+        [c for c in args.compute_types.split(",") if c],
+        _ints(args.threads),
+        _ints(args.batch_sizes),
+    ):
+        # A fresh process per candidate: nothing cached, and peak memory is its own.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                measured = pool.submit(_measure, profile, audio, args.repeat).result()
+            except Exception as exc:
+                print(f"{profile}: failed ({exc})", file=sys.stderr)
+                continue
+        fits = measured["peak_rss_mb"] <= limit
+        results.append({**asdict(profile), **measured, "fits": fits})
+        print(
+            f"{profile.model_size:<9} {profile.compute_type:<8} threads={profile.threads:<3} "
+            f"batch={profile.batch_size:<3} rtf={measured['real_time_factor']:.3f} "
+            f"peak={measured['peak_rss_mb']}MB{'' if fits else ' (over budget)'}",
+            flush=True,
+        )
+
+    fitting = [r for r in results if r["fits"]]
+    if not fitting:
+        print(f"No profile fits in {limit} MB", file=sys.stderr)
+        return 1
+    best = min(fitting, key=lambda r: r["seconds"])
+    profile = RuntimeProfile(best["model_size"], best["compute_type"], best["threads"], best["batch_size"])
+    print(f"Fastest: {profile} (real-time factor {best['real_time_factor']})")
+    if args.dry_run:
+        return 0
+    save_profile(
+        profile,
+        args.out,
+        tuned_at=datetime.utcnow().isoformat(),
+        cpus=cpus,
+        memory_limit_mb=limit,
+        real_time_factor=best["real_time_factor"],
+        peak_rss_mb=best["peak_rss_mb"],
+        candidates=results,
+    )
+    print(f"Saved to {args.out}")
+    overridden = [var for var, _ in ENV_VARS.values() if os.getenv(var)]
+    if overridden:
+        print(f"Note: {', '.join(overridden)} set in the environment take precedence over the saved profile")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""Headless batch transcription of a directory tree into the app's database.
+
+    python -m app.batch /srv/archive --user alice --processes 4
+
+Each worker process loads the models once and runs the same pipeline as the
+web app's workers, so results show up in the web interface, are searchable
+and are reused for identical uploads. Progress is appended to a manifest
+(``<dir>/.4ears-manifest.jsonl`` by default); running the command again
+skips finished files and transcribes interrupted ones again, reusing the
+stage artifacts (decoded audio, ASR, alignment) they had finished.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from .db import SessionLocal, Transcript, User, init_db
+from .pipeline import hf_token_for, pipeline_signature
+from .storage import hash_file, store_upload
+
+SUPPORTED_FORMATS = (".wav", ".m4a", ".mp3", ".mp4", ".mkv", ".flac", ".ogg", ".opus", ".webm")
+
+
+class Manifest:
+    """Append-only JSON lines log of batch progress; the last entry for a path wins."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; the file's next run rewrites it.
+                        continue
+                    self.entries[entry["path"]] = entry
+        self._fh = open(path, "a")
+
+    def record(self, path: str, status: str, **fields) -> None:
+        entry = {"path": path, "status": status, "at": datetime.utcnow().isoformat(), **fields}
+        self.entries[path] = entry
+        self._fh.write(json.dumps(entry) + "\n")
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def scan(root: str, manifest: Manifest, retry_failed: bool) -> list[str]:
+    """Return the media files under ``root`` that still need transcribing, largest first."""
+    files = []
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            if not name.lower().endswith(SUPPORTED_FORMATS):
+                continue
+            path = os.path.abspath(os.path.join(dirpath, name))
+            status = manifest.entries.get(path, {}).get("status")
+            if status == "done" or (status == "failed" and not retry_failed):
+                continue
+            files.append(path)
+    # Starting with the longest recordings keeps every worker busy until the end.
+    files.sort(key=os.path.getsize, reverse=True)
+    return files
+
+
+def _init_worker() -> None:
+    # Load the models once per process, before the first file arrives.
+    from .models import warm_up
+    from .runtime import PROFILE
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    warm_up(size=PROFILE.model_size, compute_type=PROFILE.compute_type, threads=PROFILE.threads)
+
+
+def _transcribe(transcript_id: int, path: str) -> dict:
+    """Run the pipeline for one file in a worker process and report the outcome."""
+    from .transcribe import transcribe_file
+
+    transcribe_file(transcript_id, path)
+    db = SessionLocal()
+    try:
+        row = db.query(Transcript.status, Transcript.result, Transcript.metrics).filter(
+            Transcript.id == transcript_id
+        ).one()
+    finally:
+        db.close()
+    metrics = json.loads(row.metrics) if row.metrics else {}
+    return {
+        "status": row.status,
+        "error": row.result if row.status == "failed" else None,
+        "audio_seconds": metrics.get("audio_seconds"),
+    }
+
+
+def _prepare(db, path: str, root: str, user: User | None, previous: dict | None, copy_media: bool) -> tuple[int, str]:
+    """Create (or, for an interrupted file, reuse) the transcript row; returns ``(id, media path)``."""
+    if previous and previous.get("transcript_id") and db.get(Transcript, previous["transcript_id"]):
+        # Reusing the row keeps the transcript id the manifest and the web app know.
+        return previous["transcript_id"], previous.get("media", path)
+    if copy_media:
+        with open(path, "rb") as fh:
+            content_hash, media = store_upload(fh)
+    else:
+        content_hash, media = hash_file(path), path
+    record = Transcript(
+        filename=os.path.relpath(path, root),
+        user_id=user.id if user else None,
+        status="pending",
+        content_hash=content_hash,
+        # Re-runs and archives read the original when it was not copied.
+        media_path=None if copy_media else path,
+        pipeline=pipeline_signature(hf_token_for(user)),
+    )
+    db.add(record)
+    db.commit()
+    return record.id, media
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Progress:
+    """Throughput and ETA, estimated from bytes since file size tracks duration."""
+
+    def __init__(self, files: list[str]) -> None:
+        self.total = len(files)
+        self.sizes = {f: os.path.getsize(f) for f in files}
+        self.total_bytes = sum(self.sizes.values()) or 1
+        self.done = self.failed = 0
+        self.done_bytes = 0
+        self.audio_seconds = 0.0
+        self.started = time.monotonic()
+
+    def update(self, path: str, outcome: dict) -> str:
+        if outcome["status"] == "completed":
+            self.done += 1
+        else:
+            self.failed += 1
+        self.done_bytes += self.sizes[path]
+        self.audio_seconds += outcome.get("audio_seconds") or 0
+        elapsed = time.monotonic() - self.started
+        finished = self.done + self.failed
+        eta = elapsed * (self.total_bytes - self.done_bytes) / max(self.done_bytes, 1)
+        return (
+            f"[{finished}/{self.total}] {outcome['status']:<9} {os.path.basename(path)} | "
+            f"{finished / elapsed * 3600:.0f} files/h, {self.audio_seconds / elapsed:.1f}x realtime, "
+            f"{self.failed} failed, ETA {_duration(eta)}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="directory to scan for recordings")
+    parser.add_argument("--processes", type=int, default=max(1, cpus // 4), help="worker processes")
+    parser.add_argument("--threads", type=int, help="ASR threads per process (default: cores / processes)")
+    parser.add_argument("--user", help="username that will own the transcripts")
+    parser.add_argument("--manifest", help="progress file (default: <root>/.4ears-manifest.jsonl)")
+    parser.add_argument("--retry-failed", action="store_true", help="try files that failed before again")
+    parser.add_argument("--copy-media", action="store_true", help="also copy recordings into the app's media store")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+    root = os.path.abspath(args.root)
+    if not os.path.isdir(root):
+        parser.error(f"{root} is not a directory")
+    init_db()
+    db = SessionLocal()
+    user = None
+    if args.user:
+        user = db.query(User).filter(User.username == args.user).first()
+        if not user:
+            parser.error(f"unknown user {args.user}")
+
+    manifest = Manifest(args.manifest or os.path.join(root, ".4ears-manifest.jsonl"))
+    files = scan(root, manifest, args.retry_failed)
+    if not files:
+        print("Nothing to do")
+        return 0
+    print(f"{len(files)} files to transcribe with {args.processes} processes")
+
+    # Parallelism comes from processes, so each one gets its share of the cores
+    # and transcribes long files in one pass instead of starting a pool of its own.
+    # Spawned workers inherit these settings.
+    os.environ["ASR_THREADS"] = str(args.threads or max(1, cpus // args.processes))
+    os.environ["LONG_AUDIO_SECONDS"] = str(10**9)
+
+    progress = Progress(files)
+    pending = iter(files)
+    running = {}
+    interrupted = False
+    pool = ProcessPoolExecutor(
+        max_workers=args.processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    try:
+        while True:
+            # Keep a small backlog so hashing the next files overlaps with transcription.
+            while len(running) < args.processes * 2:
+                path = next(pending, None)
+                if path is None:
+                    break
+                try:
+                    transcript_id, media = _prepare(
+                        db, path, root, user, manifest.entries.get(path), args.copy_media
+                    )
+                except OSError as exc:
+                    manifest.record(path, "failed", error=str(exc))
+                    print(progress.update(path, {"status": "failed"}), flush=True)
+                    continue
+                if db.get(Transcript, transcript_id).status == "completed":
+                    # Finished just before an interruption, but never recorded.
+                    manifest.record(path, "done", transcript_id=transcript_id)
+                    print(progress.update(path, {"status": "completed"}), flush=True)
+                    continue
+                manifest.record(path, "started", transcript_id=transcript_id, media=media)
+                running[pool.submit(_transcribe, transcript_id, media)] = (path, transcript_id)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, transcript_id = running.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as exc:
+                    outcome = {"status": "failed", "error": str(exc)}
+                if outcome["status"] == "completed":
+                    manifest.record(path, "done", transcript_id=transcript_id, audio_seconds=outcome.get("audio_seconds"))
+                else:
+                    manifest.record(path, "failed", transcript_id=transcript_id, error=outcome.get("error"))
+                print(progress.update(path, outcome), flush=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=interrupted)
+        manifest.close()
+        db.close()
+    print(f"Finished: {progress.done} transcribed, {progress.failed} failed")
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""Offline benchmark of the transcription pipeline.
+
+Generates synthetic recordings with ffmpeg, decodes them, runs them through
+the worker's own ``transcribe._run_whisperx`` (VAD packing and the stage
+graph included), then formats and persists the result, and writes the
+timings to JSON. Models are replaced by deterministic stubs unless
+``--real`` is given, so the suite runs on a CPU box without network access.
+When a baseline is passed, the run fails if any stage got slower than
+allowed::
+
+    python -m app.bench --lengths 60,600 --formats wav,mp3 --out bench.json
+    python -m app.bench --baseline bench.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+# Persist into a scratch database, never the application's.
+_DB_DIR = tempfile.TemporaryDirectory(prefix="4ears-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR.name, 'bench.sqlite3')}"
+
+import numpy as np
+import pandas as pd
+
+from . import transcribe
+from .audio import decode_audio, SAMPLE_RATE
+from .db import SessionLocal, Transcript, engine, init_db
+from .metrics import JobMetrics
+from .search import index_transcript
+from .segments import format_text, save_segments
+
+# "pipeline" is the wall time of _run_whisperx; the stages inside it overlap.
+STAGES = ("decode", "vad", "asr", "align", "diarize", "pipeline", "format", "persist")
+_CODECS = {"wav": [], "mp3": ["-c:a", "libmp3lame", "-b:a", "64k"], "m4a": ["-c:a", "aac", "-b:a", "64k"]}
+# Differences smaller than this are treated as noise whatever the threshold.
+_MIN_REGRESSION_SECONDS = 0.05
+
+
+def make_audio(path: str, seconds: int) -> None:
+    """Write ``seconds`` of speech-like audio: tones with noise, broken by pauses."""
+    fmt = os.path.splitext(path)[1].lstrip(".")
+    source = (
+        f"sine=frequency=220:sample_rate={SAMPLE_RATE}:duration={seconds},"
+        # Four seconds of sound, then one of silence, like sentences.
+        "volume='if(lt(mod(t,5),4),1,0)':eval=frame"
+    )
+    subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-y",
+            "-f", "lavfi", "-i", source,
+            "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.02:sample_rate={SAMPLE_RATE}:duration={seconds}",
+            "-filter_complex", "amix=inputs=2:duration=shortest",
+            "-ac", "1", *_CODECS[fmt], path,
+        ],
+        check=True,
+    )
+
+
+class StubModels:
+    """Deterministic stand-ins for the WhisperX models.
+
+    Output has the same shape as the real models', one segment per five
+    seconds with a word per second and a speaker turn per fifteen seconds,
+    so the format and persist stages see realistic volumes. Each stub
+    touches every sample once, as a lower bound on what any model has to do.
+    """
+
+    hf_token = "stub"
+
+    def install(self) -> None:
+        transcribe.get_asr_model = lambda *args, **kwargs: self
+        transcribe.get_align_model = lambda language: (None, None)
+        transcribe.get_diarize_model = lambda hf_token: self.diarize
+        # Speaker assignment is plain code, so the real one is timed.
+        self.assign_word_speakers = transcribe.whisperx.assign_word_speakers
+        transcribe.whisperx = self
+        # Windows of long audio run in spawned processes the stubs cannot reach.
+        transcribe.LONG_AUDIO_SECONDS = sys.maxsize
+
+    def transcribe(self, audio: np.ndarray, batch_size: int = 16, language: str | None = None) -> dict:
+        energy = float(np.abs(audio).mean()) if len(audio) else 0.0
+        seconds = len(audio) / SAMPLE_RATE
+        segments = []
+        for i, start in enumerate(np.arange(0, seconds, 5.0)):
+            end = min(start + 5.0, seconds)
+            segments.append(
+                {"start": float(start), "end": float(end), "text": f" segment {i} level {energy:.3f}"}
+            )
+        return {"segments": segments, "language": "en"}
+
+    def align(self, segments: list[dict], model, metadata, audio: np.ndarray, device: str = "cpu") -> dict:
+        np.abs(audio).max(initial=0)
+        for seg in segments:
+            seg["words"] = [
+                {"word": f"w{n}", "start": t, "end": min(t + 0.8, seg["end"])}
+                for n, t in enumerate(np.arange(seg["start"], seg["end"], 1.0).tolist())
+            ]
+        return {"segments": segments, "word_segments": [w for seg in segments for w in seg["words"]]}
+
+    def diarize(self, audio: np.ndarray) -> pd.DataFrame:
+        np.square(audio).sum()
+        seconds = len(audio) / SAMPLE_RATE
+        starts = np.arange(0, seconds, 15.0)
+        return pd.DataFrame(
+            {
+                "start": starts,
+                "end": np.minimum(starts + 15.0, seconds),
+                "speaker": [f"SPEAKER_{i % 2:02d}" for i in range(len(starts))],
+            }
+        )
+
+
+class RealModels:
+    """The CPU models the service uses, loaded once before timing starts."""
+
+    def __init__(self, hf_token: str | None) -> None:
+        self.hf_token = hf_token
+
+    def install(self) -> None:
+        from .models import get_asr_model, get_align_model, get_diarize_model
+        from .runtime import PROFILE
+
+        get_asr_model(PROFILE.model_size, PROFILE.compute_type, threads=PROFILE.threads)
+        get_align_model("en")
+        if self.hf_token:
+            get_diarize_model(self.hf_token)
+
+
+def run_once(path: str, models) -> dict[str, float]:
+    """Run the pipeline on ``path`` once and return seconds per stage."""
+    timings: dict[str, float] = {}
+
+    def timed(stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        value = fn(*args, **kwargs)
+        timings[stage] = time.perf_counter() - started
+        return value
+
+    metrics = JobMetrics("bench")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        audio = timed("decode", decode_audio, path, temp_dir)
+        segments = timed("pipeline", transcribe._run_whisperx, audio, models.hf_token, metrics=metrics)
+        text = timed("format", format_text, segments)
+        timed("persist", _persist, os.path.basename(path), segments, text)
+    metrics.finish()
+    for stage in ("vad", "asr", "align", "diarize"):
+        timings[stage] = metrics.stages.get(stage, 0.0)
+    return timings
+
+
+def _persist(filename: str, segments: list[dict], text: str) -> None:
+    db = SessionLocal()
+    try:
+        record = Transcript(filename=filename, status="completed", result=text)
+        db.add(record)
+        db.flush()
+        save_segments(db, record.id, segments)
+        db.flush()
+        index_transcript(db, record)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(lengths: list[int], formats: list[str], repeat: int, models) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as media_dir:
+        for seconds in lengths:
+            for fmt in formats:
+                path = os.path.join(media_dir, f"synthetic-{seconds}s.{fmt}")
+                make_audio(path, seconds)
+                runs = [run_once(path, models) for _ in range(repeat)]
+                # The median is robust against a single run hit by a noisy neighbour.
+                timings = {stage: statistics.median(r[stage] for r in runs) for stage in STAGES}
+                results[f"{seconds}s.{fmt}"] = timings
+                print(
+                    f"{seconds:>6}s {fmt:<4} " + " ".join(f"{s}={timings[s]:.3f}" for s in STAGES),
+                    flush=True,
+                )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return a message for every stage that is slower than ``baseline`` allows."""
+    regressions = []
+    for case, stages in results.items():
+        before = baseline.get(case)
+        if not before:
+            continue
+        for stage, seconds in stages.items():
+            old = before.get(stage)
+            if old is None:
+                continue
+            if seconds - old > _MIN_REGRESSION_SECONDS and seconds > old * (1 + threshold):
+                regressions.append(f"{case} {stage}: {old:.3f}s -> {seconds:.3f}s")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", default="30,300", help="comma separated durations in seconds")
+    parser.add_argument("--formats", default="wav,mp3", help=f"comma separated, from {', '.join(_CODECS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--real", action="store_true", help="use the real WhisperX models instead of stubs")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown per stage, as a fraction")
+    args = parser.parse_args(argv)
+
+    formats = [f for f in args.formats.split(",") if f]
+    unknown = set(formats) - set(_CODECS)
+    if unknown:
+        parser.error(f"unsupported formats: {', '.join(sorted(unknown))}")
+
+    try:
+        init_db()
+        models = RealModels(os.getenv("HF_TOKEN") or None) if args.real else StubModels()
+        models.install()
+        results = run([int(n) for n in args.lengths.split(",") if n], formats, args.repeat, models)
+    finally:
+        engine.dispose()
+        _DB_DIR.cleanup()
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "models": "real" if args.real else "stub",
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline.get("models") != report["models"]:
+            print(f"Baseline used {baseline.get('models')} models, this run {report['models']}", file=sys.stderr)
+            return 2
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import os
+import logging
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable
+
+import numpy as np
+
+from .audio import SAMPLE_RATE
+from .models import get_asr_model
+
+logger = logging.getLogger(__name__)
+
+LONG_AUDIO_SECONDS = int(os.getenv("LONG_AUDIO_SECONDS", "1800"))
+# Shorter audio is transcribed in-process, piece by piece, so a cancelled
+# job stops within one piece.
+PIECE_SECONDS = int(os.getenv("ASR_PIECE_SECONDS", "300"))
+WINDOW_SECONDS = int(os.getenv("LONG_AUDIO_WINDOW_SECONDS", "600"))
+OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", "5"))
+# How far around each nominal boundary to look for the quietest point; at
+# most a quarter window, so a cut never lands behind the previous one.
+SEARCH_SECONDS = 30
+_FRAME = int(0.03 * SAMPLE_RATE)
+
+_CPUS = os.cpu_count() or 1
+PROCESSES = int(os.getenv("LONG_AUDIO_PROCESSES") or max(1, _CPUS // 2))
+THREADS_PER_PROCESS = max(1, _CPUS // PROCESSES)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # The pool is kept for the life of the process so each worker keeps its
+    # ASR model resident between jobs.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def find_split_points(audio: np.ndarray, window: float = WINDOW_SECONDS) -> list[int]:
+    """Return sample offsets that cut ``audio`` into ~``window`` second pieces.
+
+    Each cut is placed at the lowest-energy frame near the nominal boundary so
+    that words are rarely split. The first point is 0 and the last is ``len(audio)``.
+    """
+    window_samples = int(window * SAMPLE_RATE)
+    search = int(min(SEARCH_SECONDS, window / 4) * SAMPLE_RATE)
+    points = [0]
+    pos = 0
+    while len(audio) - pos > window_samples * 1.25:
+        target = pos + window_samples
+        lo, hi = target - search, min(target + search, len(audio))
+        frames = (hi - lo) // _FRAME
+        if frames > 0:
+            region = np.asarray(audio[lo:lo + frames * _FRAME]).reshape(frames, _FRAME)
+            energy = np.square(region).mean(axis=1)
+            pos = lo + int(np.argmin(energy)) * _FRAME + _FRAME // 2
+        else:
+            pos = target
+        points.append(pos)
+    points.append(len(audio))
+    assert all(a < b for a, b in zip(points, points[1:])), "split points must increase"
+    return points
+
+
+def transcribe_pieces(
+    model,
+    audio: np.ndarray,
+    batch_size: int = 16,
+    check: Callable[[], None] | None = None,
+) -> dict:
+    """Transcribe ``audio`` with ``model`` in consecutive pieces split at quiet points.
+
+    ``check`` is called before each piece and may raise to stop. The language
+    detected on the first piece is used for the rest.
+    """
+    points = find_split_points(audio, PIECE_SECONDS)
+    language = None
+    segments = []
+    for start, end in zip(points[:-1], points[1:]):
+        if check:
+            check()
+        result = model.transcribe(audio[start:end], batch_size=batch_size, language=language)
+        language = language or result.get("language")
+        offset = start / SAMPLE_RATE
+        segments.extend(
+            {**seg, "start": seg["start"] + offset, "end": seg["end"] + offset}
+            for seg in result.get("segments", [])
+        )
+    return {"segments": segments, "language": language}
+
+
+def plan_windows(audio: np.ndarray) -> list[tuple[int, int]]:
+    """Return the (start, end) sample ranges each window owns, without overlap."""
+    points = find_split_points(audio)
+    return list(zip(points[:-1], points[1:]))
+
+
+def _transcribe_window(
+    samples: np.ndarray,
+    offset: float,
+    core: tuple[float, float],
+    size: str,
+    compute_type: str,
+    batch_size: int,
+) -> tuple[str | None, list[dict]]:
+    """Transcribe one window in a pool process and return segments on the global timeline."""
+    model = get_asr_model(size, compute_type, threads=THREADS_PER_PROCESS)
+    result = model.transcribe(samples, batch_size=batch_size)
+    segments = []
+    for seg in result.get("segments", []):
+        start = seg["start"] + offset
+        end = seg["end"] + offset
+        # Overlapping audio is transcribed twice; keep a segment only in the
+        # window whose core region contains its midpoint.
+        if core[0] <= (start + end) / 2 < core[1]:
+            segments.append({"start": start, "end": end, "text": seg["text"]})
+    return result.get("language"), segments
+
+
+def transcribe_long(
+    audio: np.ndarray,
+    size: str,
+    compute_type: str,
+    batch_size: int = 16,
+    done: dict[int, dict] | None = None,
+    on_chunk: Callable[[int, int, int, dict], None] | None = None,
+    check: Callable[[], None] | None = None,
+) -> dict:
+    """Transcribe long audio as overlapping windows spread over a process pool.
+
+    ``done`` maps window index to results persisted by an earlier attempt; those
+    windows are skipped when their boundaries still match. ``on_chunk`` is called
+    with ``(index, total, start_sample, result)`` as each window finishes.
+    ``check`` is called between windows and may raise to stop; windows not
+    yet started are then cancelled.
+    """
+    windows = plan_windows(audio)
+    done = done or {}
+    overlap = int(OVERLAP_SECONDS * SAMPLE_RATE)
+    results: dict[int, dict] = {}
+    futures = {}
+    pool = _get_pool()
+    for index, (start, end) in enumerate(windows):
+        previous = done.get(index)
+        if previous and previous.get("start") == start and previous.get("end") == end:
+            results[index] = previous
+            continue
+        lo, hi = max(0, start - overlap), min(len(audio), end + overlap)
+        future = pool.submit(
+            _transcribe_window,
+            np.ascontiguousarray(audio[lo:hi]),
+            lo / SAMPLE_RATE,
+            (start / SAMPLE_RATE, end / SAMPLE_RATE),
+            size,
+            compute_type,
+            batch_size,
+        )
+        futures[future] = (index, start, end)
+
+    logger.info(
+        "Transcribing %d windows (%d resumed) on %d processes",
+        len(windows), len(results), PROCESSES,
+    )
+    try:
+        for future in as_completed(futures):
+            if check:
+                check()
+            index, start, end = futures[future]
+            language, segments = future.result()
+            results[index] = {"start": start, "end": end, "language": language, "segments": segments}
+            if on_chunk:
+                on_chunk(index, len(windows), start, results[index])
+    except BaseException:
+        # The pool is shared, so release the windows that have not started yet.
+        for future in futures:
+            future.cancel()
+        raise
+
+    languages = Counter(r.get("language") for r in results.values() if r.get("language"))
+    segments = [seg for index in sorted(results) for seg in results[index]["segments"]]
+    segments.sort(key=lambda seg: seg["start"])
+    return {
+        "segments": segments,
+        "language": languages.most_common(1)[0][0] if languages else None,
+    }
@@ -0,0 +1,136 @@
+"""Compression of stored transcript text and encoding of text downloads.
+
+Transcripts and summaries are stored as zstd frames when the optional
+``zstandard`` package is installed and as gzip otherwise; short values stay
+plain UTF-8. Every stored value identifies its own format by its first
+bytes, so rows written under different settings can be read side by side.
+"""
+import os
+import gzip
+import zlib
+import logging
+from typing import Iterator
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used instead
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC = os.getenv("TEXT_COMPRESSION", "zstd" if zstandard else "gzip").lower()
+if CODEC == "zstd" and zstandard is None:
+    logger.warning("TEXT_COMPRESSION=zstd but zstandard is not installed; using gzip")
+    CODEC = "gzip"
+# Below this many bytes compression saves too little to be worth it.
+MIN_BYTES = int(os.getenv("TEXT_COMPRESSION_MIN_BYTES", "512"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "10"))
+GZIP_LEVEL = 6
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_GZIP_MAGIC = b"\x1f\x8b"
+CHUNK_BYTES = 64 * 1024
+
+
+def _as_bytes(data: bytes | str) -> bytes:
+    # Values written before compression was introduced come back as text.
+    return data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+
+def compress(text: str) -> bytes:
+    """Encode ``text`` for storage with the configured codec."""
+    data = text.encode("utf-8")
+    if len(data) < MIN_BYTES or CODEC == "none":
+        return data
+    if CODEC == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def codec_of(data: bytes) -> str | None:
+    """Return ``"zstd"``, ``"gzip"`` or ``None`` for plain UTF-8.
+
+    Neither magic number is valid UTF-8, so plain text is never mistaken for them.
+    """
+    if data.startswith(_ZSTD_MAGIC):
+        return "zstd"
+    if data.startswith(_GZIP_MAGIC):
+        return "gzip"
+    return None
+
+
+def _require_zstd() -> None:
+    if zstandard is None:
+        raise RuntimeError("Text is stored with zstd; install the zstandard package to read it")
+
+
+def decompress(data: bytes | str) -> str:
+    """Inverse of ``compress``; accepts any of the stored formats."""
+    data = _as_bytes(data)
+    codec = codec_of(data)
+    if codec == "zstd":
+        _require_zstd()
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "gzip":
+        data = gzip.decompress(data)
+    return data.decode("utf-8")
+
+
+def iter_decompressed(data: bytes | str) -> Iterator[bytes]:
+    """Yield the UTF-8 text of a stored value in chunks, without expanding it all at once."""
+    data = memoryview(_as_bytes(data))
+    codec = codec_of(data[:4].tobytes())
+    if codec == "zstd":
+        _require_zstd()
+        yield from zstandard.ZstdDecompressor().read_to_iter(
+            data, read_size=CHUNK_BYTES, write_size=CHUNK_BYTES
+        )
+    elif codec == "gzip":
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        for pos in range(0, len(data), CHUNK_BYTES):
+            chunk = decompressor.decompress(data[pos:pos + CHUNK_BYTES])
+            if chunk:
+                yield chunk
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    else:
+        for pos in range(0, len(data), CHUNK_BYTES):
+            yield data[pos:pos + CHUNK_BYTES].tobytes()
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _accepted(accept_encoding: str) -> set[str]:
+    codings = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if coding and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            codings.add(coding)
+    return codings
+
+
+def encode_for(data: bytes | str, accept_encoding: str) -> tuple[Iterator[bytes], str | None]:
+    """Body chunks and ``Content-Encoding`` for sending a stored value to a client.
+
+    Stored frames the client can decode are sent as they are, without
+    decompressing them on the server. Otherwise zstd text is re-encoded as
+    gzip on the fly, or sent as plain text if the client accepts neither.
+    """
+    data = _as_bytes(data)
+    codec = codec_of(data)
+    accepted = _accepted(accept_encoding)
+    if codec and codec in accepted:
+        view = memoryview(data)
+        return (view[pos:pos + CHUNK_BYTES].tobytes() for pos in range(0, len(data), CHUNK_BYTES)), codec
+    if codec and "gzip" in accepted:
+        return _gzip(iter_decompressed(data)), "gzip"
+    return iter_decompressed(data), None
@@ -1,9 +1,19 @@
 import os
+import logging
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, inspect, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+from typing import Callable, Iterator
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, Text, DateTime, Index, LargeBinary, bindparam, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, sessionmaker, declarative_base, validates
+from sqlalchemy.types import TypeDecorator
+
+from .compression import compress, decompress
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./db/db.sqlite3")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "15000"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
 
 engine = create_engine(
     DATABASE_URL, connect_args={"check_same_thread": False}
@@ -12,31 +22,114 @@ SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
 
 
-def _ensure_schema() -> None:
-    inspector = inspect(engine)
+if engine.dialect.name == "sqlite":
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record) -> None:
+        # WAL lets readers proceed while a worker commits; NORMAL sync is
+        # durable across application crashes and much cheaper than FULL.
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
+
+def get_db() -> Iterator[Session]:
+    """FastAPI dependency providing one session per request."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+SNIPPET_LENGTH = 150
+
+
+def snippet(value: str | None) -> str | None:
+    """Short preview of a large text column shown in the transcript list."""
+    if value is None:
+        return None
+    if len(value) > SNIPPET_LENGTH:
+        return value[:SNIPPET_LENGTH] + "..."
+    return value
+
+
+def _snippet_sql(column: str) -> str:
+    return (
+        f"CASE WHEN length({column}) > {SNIPPET_LENGTH} "
+        f"THEN substr({column}, 1, {SNIPPET_LENGTH}) || '...' ELSE {column} END"
+    )
+
+
+class CompressedText(TypeDecorator):
+    """Text stored compressed (see app/compression.py); reads back as ``str``."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else compress(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else decompress(value)
+
+
+def _legacy_schema(conn: Connection) -> None:
+    """Bring databases created before versioned migrations up to date."""
+    Base.metadata.create_all(bind=conn)
+    inspector = inspect(conn)
     if "transcripts" in inspector.get_table_names():
         columns = {c["name"] for c in inspector.get_columns("transcripts")}
-        with engine.begin() as conn:
-            if "summary" not in columns:
-                conn.execute(text("ALTER TABLE transcripts ADD COLUMN summary TEXT"))
-            if "summary_status" not in columns:
-                conn.execute(
-                    text(
-                        "ALTER TABLE transcripts ADD COLUMN summary_status TEXT DEFAULT 'pending'"
-                    )
+        if "summary" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN summary TEXT"))
+        if "summary_status" not in columns:
+            conn.execute(
+                text(
+                    "ALTER TABLE transcripts ADD COLUMN summary_status TEXT DEFAULT 'pending'"
+                )
+            )
+        if "summary_mode" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN summary_mode TEXT"))
+        if "user_id" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN user_id INTEGER"))
+        if "progress" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN progress INTEGER DEFAULT 0"))
+        if "content_hash" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN content_hash TEXT"))
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_transcripts_content_hash ON transcripts (content_hash)"
                 )
-            if "summary_mode" not in columns:
-                conn.execute(text("ALTER TABLE transcripts ADD COLUMN summary_mode TEXT"))
-            if "user_id" not in columns:
-                conn.execute(text("ALTER TABLE transcripts ADD COLUMN user_id INTEGER"))
+            )
+        if "pipeline" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN pipeline TEXT"))
+        if "stage" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN stage TEXT"))
+        if "search_indexed" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN search_indexed INTEGER DEFAULT 0"))
+        if "result_snippet" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN result_snippet TEXT"))
+            conn.execute(text(f"UPDATE transcripts SET result_snippet = {_snippet_sql('result')}"))
+        if "summary_snippet" not in columns:
+            conn.execute(text("ALTER TABLE transcripts ADD COLUMN summary_snippet TEXT"))
+            conn.execute(text(f"UPDATE transcripts SET summary_snippet = {_snippet_sql('summary')}"))
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_transcripts_user_created ON transcripts (user_id, created_at)"
+            )
+        )
 
     if "users" in inspector.get_table_names():
         columns = {c["name"] for c in inspector.get_columns("users")}
-        with engine.begin() as conn:
-            if "ollama_url" not in columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN ollama_url TEXT"))
-            if "ollama_model" not in columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN ollama_model TEXT"))
+        if "ollama_url" not in columns:
+            conn.execute(text("ALTER TABLE users ADD COLUMN ollama_url TEXT"))
+        if "ollama_model" not in columns:
+            conn.execute(text("ALTER TABLE users ADD COLUMN ollama_model TEXT"))
 
 class Transcript(Base):
     __tablename__ = "transcripts"
@@ -44,13 +137,76 @@ class Transcript(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     status = Column(String, default="pending")
-    result = Column(String, nullable=True)
-    summary = Column(String, nullable=True)
+    # Compressed; query them with type_coerce(..., LargeBinary) to get the stored bytes.
+    result = Column(CompressedText, nullable=True)
+    summary = Column(CompressedText, nullable=True)
     summary_status = Column(String, default="pending")
     summary_mode = Column(String, nullable=True)
     user_id = Column(Integer, nullable=True, index=True)
+    progress = Column(Integer, default=0)
+    stage = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True, index=True)
+    # Original file for media left outside the object store (batch runs without --copy-media).
+    media_path = Column(String, nullable=True)
+    pipeline = Column(String, nullable=True)
+    # JSON timings of the last transcription run, see app/metrics.py
+    metrics = Column(Text, nullable=True)
+    result_snippet = Column(String, nullable=True)
+    summary_snippet = Column(String, nullable=True)
+    search_indexed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_transcripts_user_created", "user_id", "created_at"),)
+
+    @validates("result", "summary")
+    def _update_snippet(self, key, value):
+        setattr(self, f"{key}_snippet", snippet(value))
+        return value
+
+class TranscriptChunk(Base):
+    __tablename__ = "transcript_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    transcript_id = Column(Integer, nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    start_sample = Column(Integer, nullable=False)
+    end_sample = Column(Integer, nullable=False)
+    language = Column(String, nullable=True)
+    segments = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class SummaryChunk(Base):
+    __tablename__ = "summary_chunks"
+
+    id = Column(Integer, primary_key=True)
+    transcript_id = Column(Integer, nullable=False, index=True)
+    key = Column(String, nullable=False, index=True)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SummaryCache(Base):
+    __tablename__ = "summary_cache"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String, nullable=False, unique=True)
+    summary = Column(Text, nullable=False)
+    size = Column(Integer, default=0)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Segment(Base):
+    __tablename__ = "segments"
+
+    id = Column(Integer, primary_key=True)
+    transcript_id = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)
+    start = Column(Float, nullable=False)
+    end = Column(Float, nullable=False)
+    speaker = Column(String, nullable=True)
+    text = Column(Text, nullable=False)
+    words = Column(Text, nullable=True)
+
+    __table_args__ = (Index("ix_segments_transcript_start", "transcript_id", "start"),)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -63,5 +219,193 @@ class User(Base):
     ollama_model = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-Base.metadata.create_all(bind=engine)
-_ensure_schema()
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    queue = Column(String, nullable=False, index=True)
+    transcript_id = Column(Integer, nullable=True, index=True)
+    payload = Column(Text, nullable=True)
+    # Scheduling inputs, see claim() in app/jobs.py
+    user_id = Column(Integer, nullable=True)
+    priority = Column(Integer, default=1)
+    cost = Column(Float, nullable=True)
+    status = Column(String, default="queued", index=True)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class Recording(Base):
+    __tablename__ = "recordings"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    transcript_id = Column(Integer, nullable=False, index=True)
+    status = Column(String, default="recording")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class RecordingChunk(Base):
+    __tablename__ = "recording_chunks"
+
+    id = Column(Integer, primary_key=True)
+    recording_id = Column(Integer, nullable=False)
+    seq = Column(Integer, nullable=False)
+    path = Column(String, nullable=False)
+    offset = Column(Float, nullable=True)
+    duration = Column(Float, nullable=True)
+    status = Column(String, default="queued")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_recording_chunks_recording_seq", "recording_id", "seq", unique=True),)
+
+class Upload(Base):
+    __tablename__ = "uploads"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    transcript_id = Column(Integer, nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    # Job priority of the transcription, see app/jobs.py
+    priority = Column(Integer, default=1)
+    # Partial file until the worker has stored it, the stored object after.
+    path = Column(String, nullable=False)
+    # uploading -> complete (all chunks received) -> stored; or expired / cancelled
+    status = Column(String, default="uploading")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
+
+    id = Column(Integer, primary_key=True)
+    upload_id = Column(Integer, nullable=False)
+    seq = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_upload_chunks_upload_seq", "upload_id", "seq", unique=True),)
+
+def _create_tables(*tables) -> Callable[[Connection], None]:
+    def migrate(conn: Connection) -> None:
+        Base.metadata.create_all(bind=conn, tables=[t.__table__ for t in tables])
+    migrate.__name__ = "create_" + "_".join(t.__tablename__ for t in tables)
+    return migrate
+
+
+def _add_column(table: str, column: str, ddl: str) -> Callable[[Connection], None]:
+    def migrate(conn: Connection) -> None:
+        # Fresh databases already have the column from create_all.
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    migrate.__name__ = f"add_{table}_{column}"
+    return migrate
+
+
+def _compress_transcripts(conn: Connection) -> None:
+    """Rewrite transcripts and summaries saved as plain text in the compressed format."""
+    ids = [row[0] for row in conn.execute(text("SELECT id FROM transcripts ORDER BY id"))]
+    for pos in range(0, len(ids), 200):
+        rows = conn.execute(
+            text("SELECT id, result, summary FROM transcripts WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids[pos:pos + 200]},
+        ).all()
+        for row in rows:
+            values = {
+                key: compress(value)
+                for key, value in (("result", row.result), ("summary", row.summary))
+                if isinstance(value, str)
+            }
+            if values:
+                assignments = ", ".join(f"{key} = :{key}" for key in values)
+                conn.execute(text(f"UPDATE transcripts SET {assignments} WHERE id = :id"), {"id": row.id, **values})
+
+
+def _backfill_segments(conn: Connection) -> None:
+    """Create segments for transcripts finished before segments were stored."""
+    from .segments import parse_text  # segments imports this module
+
+    ids = [
+        row[0]
+        for row in conn.execute(
+            text(
+                "SELECT id FROM transcripts WHERE status = 'completed' AND result IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM segments WHERE segments.transcript_id = transcripts.id) "
+                "ORDER BY id"
+            )
+        )
+    ]
+    for pos in range(0, len(ids), 200):
+        rows = conn.execute(
+            text("SELECT id, result FROM transcripts WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids[pos:pos + 200]},
+        ).all()
+        values = [
+            {
+                "transcript_id": row.id,
+                "position": i,
+                "start": seg["start"],
+                "end": seg["end"],
+                "speaker": seg.get("speaker"),
+                "text": seg["text"],
+            }
+            for row in rows
+            for i, seg in enumerate(parse_text(decompress(row.result)))
+        ]
+        if values:
+            conn.execute(Segment.__table__.insert(), values)
+
+
+def _search_index(conn: Connection) -> None:
+    if conn.dialect.name == "sqlite":
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                "text, owner, transcript_id UNINDEXED, kind UNINDEXED, start UNINDEXED, "
+                "tokenize = 'porter unicode61')"
+            )
+        )
+
+
+# Ordered schema migrations. Each runs once, in its own transaction, and is
+# recorded in schema_version; append new steps, never edit applied ones.
+# Steps must be idempotent because two processes may start at the same time.
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _legacy_schema,
+    _search_index,
+    _create_tables(Recording, RecordingChunk),
+    _add_column("transcripts", "metrics", "TEXT"),
+    _compress_transcripts,
+    _create_tables(Upload, UploadChunk),
+    _add_column("jobs", "user_id", "INTEGER"),
+    _add_column("jobs", "priority", "INTEGER DEFAULT 1"),
+    _add_column("jobs", "cost", "FLOAT"),
+    _backfill_segments,
+    _add_column("transcripts", "media_path", "TEXT"),
+    _add_column("uploads", "priority", "INTEGER DEFAULT 1"),
+]
+
+
+def init_db() -> None:
+    """Apply pending migrations. Cheap when the schema is current."""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    for version, migrate in enumerate(MIGRATIONS[current:], start=current + 1):
+        with engine.begin() as conn:
+            applied = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+            if applied >= version:
+                continue
+            logger.info("Applying schema migration %d (%s)", version, migrate.__name__)
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
@@ -0,0 +1,164 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Any
+
+from sqlalchemy import or_
+
+from .db import SessionLocal, Transcript
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_SIZE = 256
+RELAY_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "1"))
+
+
+def _offer(queue: asyncio.Queue, event: dict) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # A slow client only misses intermediate updates; the next event
+        # carries the full current state of the job.
+        pass
+
+
+class EventBus:
+    """In-process pub/sub that fans job progress out to per-user subscribers.
+
+    Publishers are worker threads; subscribers are SSE handlers running on the
+    event loop, so delivery goes through ``call_soon_threadsafe``.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: dict[Any, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int | None) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(entry)
+        return queue
+
+    def unsubscribe(self, user_id: int | None, queue: asyncio.Queue) -> None:
+        with self._lock:
+            entries = self._subscribers.get(user_id, set())
+            entries.difference_update({e for e in entries if e[1] is queue})
+            if not entries:
+                self._subscribers.pop(user_id, None)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def publish(self, user_id: int | None, event: dict) -> None:
+        with self._lock:
+            entries = list(self._subscribers.get(user_id, ()))
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # Loop already closed; the subscriber is gone.
+                self.unsubscribe(user_id, queue)
+
+
+bus = EventBus()
+
+
+def publish_progress(
+    transcript_id: int,
+    user_id: int | None,
+    *,
+    status: str,
+    stage: str | None = None,
+    progress: int | None = None,
+    summary_status: str | None = None,
+    summary_delta: str | None = None,
+) -> None:
+    event = {"id": transcript_id, "status": status, "stage": stage, "progress": progress}
+    if summary_status is not None:
+        event["summary_status"] = summary_status
+    if summary_delta is not None:
+        event["summary_delta"] = summary_delta
+    bus.publish(user_id, event)
+
+
+class DatabaseRelay:
+    """Publishes progress of jobs running in worker processes to this process's bus.
+
+    Workers in another process cannot reach the in-memory bus, so while
+    anyone is subscribed the web process polls the status columns of active
+    transcripts and publishes what changed. Streamed summaries are relayed as
+    the text saved since the previous poll.
+    """
+
+    def __init__(self, bus: EventBus, interval: float = RELAY_SECONDS) -> None:
+        self.bus = bus
+        self.interval = interval
+        # Last published (status, stage, progress, summary_status, summary length) per transcript.
+        self._seen: dict[int, tuple] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="event-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + 1)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self.bus.has_subscribers():
+                self._seen.clear()
+                continue
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Event relay poll failed")
+
+    def poll(self) -> None:
+        db = SessionLocal()
+        try:
+            active = or_(
+                Transcript.status.in_(("pending", "processing")),
+                Transcript.summary_status == "processing",
+            )
+            if self._seen:
+                # Also pick up rows that just left the active set, to publish their final state.
+                active = or_(active, Transcript.id.in_(list(self._seen)))
+            rows = db.query(
+                Transcript.id,
+                Transcript.user_id,
+                Transcript.status,
+                Transcript.stage,
+                Transcript.progress,
+                Transcript.summary_status,
+                # Stored compressed, so the new part is found after decompressing.
+                Transcript.summary,
+            ).filter(active).all()
+            current = set()
+            for row in rows:
+                summary = row.summary or ""
+                state = (row.status, row.stage, row.progress, row.summary_status, len(summary))
+                previous = self._seen.get(row.id)
+                if row.status in ("pending", "processing") or row.summary_status == "processing":
+                    self._seen[row.id] = state
+                    current.add(row.id)
+                else:
+                    self._seen.pop(row.id, None)
+                if previous == state:
+                    continue
+                event = {"id": row.id, "status": row.status, "stage": row.stage, "progress": row.progress}
+                if row.summary_status is not None:
+                    event["summary_status"] = row.summary_status
+                if previous is not None and len(summary) > previous[4]:
+                    event["summary_delta"] = summary[previous[4]:]
+                self.bus.publish(row.user_id, event)
+            for transcript_id in set(self._seen) - current:
+                self._seen.pop(transcript_id, None)
+        finally:
+            db.close()
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+
+class StageAborted(Exception):
+    """Raised by ``StageGraph.check`` in a stage once another stage has failed."""
+
+
+class StageGraph:
+    """Runs pipeline stages in threads as soon as the stages they depend on finish.
+
+    A stage function receives the results of its dependencies as positional
+    arguments, in the order they were declared. Stages must be added after
+    the stages they depend on, which keeps the graph acyclic.
+    """
+
+    def __init__(self) -> None:
+        self._stages: dict[str, tuple[Callable[..., Any], tuple[str, ...]]] = {}
+        self._background: set[str] = set()
+        self._failed = threading.Event()
+
+    def add(self, name: str, fn: Callable[..., Any], *after: str, background: bool = False) -> None:
+        """Add a stage. A ``background`` stage must not touch state shared with
+        the caller, because a failure elsewhere does not wait for it to stop."""
+        unknown = [dep for dep in after if dep not in self._stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on unknown stages: {', '.join(unknown)}")
+        self._stages[name] = (fn, after)
+        if background:
+            self._background.add(name)
+
+    def check(self) -> None:
+        """Stop a running stage early when another stage has failed; call between long steps."""
+        if self._failed.is_set():
+            raise StageAborted("Another pipeline stage failed")
+
+    @staticmethod
+    def _call(fn: Callable[..., Any], deps: list[Future]) -> Any:
+        return fn(*[dep.result() for dep in deps])
+
+    def run(self) -> dict[str, Any]:
+        """Run every stage and return their results by name.
+
+        On the first failure, stages not yet started are cancelled and
+        running ones see ``check`` raise; the failure is raised once they
+        have stopped, so none of them outlives the call. Background stages
+        are not waited for: one inside a single long call finishes on its own
+        and its result is dropped.
+        """
+        futures: dict[str, Future] = {}
+        # One thread per stage: a stage blocked on its dependencies holds a thread.
+        pool = ThreadPoolExecutor(max_workers=max(1, len(self._stages)), thread_name_prefix="stage")
+        try:
+            for name, (fn, after) in self._stages.items():
+                futures[name] = pool.submit(self._call, fn, [futures[dep] for dep in after])
+            wait(futures.values(), return_when=FIRST_EXCEPTION)
+            failed = [f for f in futures.values() if f.done() and f.exception() is not None]
+            if failed:
+                self._failed.set()
+                for future in futures.values():
+                    future.cancel()
+                wait([f for name, f in futures.items() if name not in self._background])
+                raise failed[0].exception()
+            return {name: future.result() for name, future in futures.items()}
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,431 @@
+import os
+import json
+import uuid
+import socket
+import logging
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from sqlalchemy import Integer, cast, func, select, update, or_, and_
+
+from .db import SessionLocal, Job
+from .metrics import JOBS, JOB_SECONDS, QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_QUEUE = "transcribe"
+LIVE_QUEUE = "live"
+SUMMARIZE_QUEUE = "summarize"
+# Decodes uploads while they arrive, without holding a transcription worker.
+DECODE_QUEUE = "decode"
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 4)
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How often a running job checks whether it has been cancelled.
+CANCEL_POLL_SECONDS = float(os.getenv("JOB_CANCEL_POLL_SECONDS", "5"))
+
+# Priority classes; lower runs first.
+PRIORITY_LIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+PRIORITIES = {"live": PRIORITY_LIVE, "normal": PRIORITY_NORMAL, "bulk": PRIORITY_BULK}
+# Fair share looks at how many seconds of media each user had processed in this window.
+FAIR_SHARE_SECONDS = int(os.getenv("JOB_FAIR_SHARE_SECONDS", "3600"))
+# A job moves up one priority class for every this many seconds it waits.
+AGING_SECONDS = int(os.getenv("JOB_AGING_SECONDS", "3600"))
+# Assumed length of media whose duration is unknown.
+DEFAULT_COST = float(os.getenv("JOB_DEFAULT_COST_SECONDS", "600"))
+_CANDIDATES_PER_USER = 20
+
+# Wakes idle workers in this process as soon as a job is enqueued locally.
+_wakeup = threading.Condition()
+_local = threading.local()
+# Running jobs in this process that have been cancelled, mapped to their transcript.
+_cancelled: dict[int, int | None] = {}
+_cancelled_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised in a job handler once its job has been cancelled."""
+
+
+def raise_if_cancelled(transcript_id: int) -> None:
+    """Stop a handler at a safe point if its transcript's jobs were cancelled."""
+    with _cancelled_lock:
+        cancelled = transcript_id in _cancelled.values()
+    if cancelled:
+        raise JobCancelled(f"Jobs of transcript {transcript_id} were cancelled")
+
+
+def current_job() -> Job | None:
+    """The job the calling worker thread is running, if any."""
+    return getattr(_local, "job", None)
+
+
+def queue_wait(job: Job) -> float:
+    """Seconds between enqueueing ``job`` and its latest claim."""
+    return (job.started_at - job.created_at).total_seconds()
+
+
+def enqueue(
+    queue: str,
+    transcript_id: int | None,
+    *,
+    user_id: int | None = None,
+    priority: int = PRIORITY_NORMAL,
+    cost: float | None = None,
+    **payload: Any,
+) -> int:
+    """Queue a job; ``cost`` is the media duration in seconds, if known."""
+    db = SessionLocal()
+    try:
+        job = Job(
+            queue=queue,
+            transcript_id=transcript_id,
+            payload=json.dumps(payload),
+            user_id=user_id,
+            priority=priority,
+            cost=cost,
+        )
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+    with _wakeup:
+        _wakeup.notify_all()
+    return job_id
+
+
+def has_active_job(queue: str, transcript_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            select(Job.id).where(
+                Job.queue == queue,
+                Job.transcript_id == transcript_id,
+                Job.status.in_(("queued", "running")),
+            ).limit(1)
+        ).first()
+        return row is not None
+    finally:
+        db.close()
+
+
+def discard_queued(queue: str, transcript_id: int) -> int:
+    """Cancel a transcript's jobs on ``queue`` that no worker has claimed yet."""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(Job)
+            .where(Job.queue == queue, Job.transcript_id == transcript_id, Job.status == "queued")
+            .values(status="cancelled", finished_at=datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def cancel(transcript_id: int, queues: tuple[str, ...]) -> int:
+    """Cancel the queued and running jobs of a transcript on ``queues``.
+
+    Queued jobs are never claimed afterwards. Workers notice cancelled
+    running jobs within ``CANCEL_POLL_SECONDS`` and their handlers stop at
+    the next safe point. Returns the number of jobs cancelled.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(Job)
+            .where(
+                Job.transcript_id == transcript_id,
+                Job.queue.in_(queues),
+                Job.status.in_(("queued", "running")),
+            )
+            .values(status="cancelled", finished_at=datetime.utcnow(), lease_expires_at=None)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def job_status(job_id: int) -> str | None:
+    db = SessionLocal()
+    try:
+        return db.execute(select(Job.status).where(Job.id == job_id)).scalar()
+    finally:
+        db.close()
+
+
+def _usage(db, queue: str, now: datetime) -> dict[int | None, float]:
+    """Seconds of media per user started on ``queue`` within the fair-share window."""
+    rows = db.execute(
+        select(Job.user_id, func.sum(func.coalesce(Job.cost, DEFAULT_COST)))
+        .where(Job.queue == queue, Job.started_at >= now - timedelta(seconds=FAIR_SHARE_SECONDS))
+        .group_by(Job.user_id)
+    ).all()
+    return {user_id: total for user_id, total in rows}
+
+
+def _aged_priority(now: datetime):
+    """SQL form of the aged priority class that ``_schedule_key`` ranks by."""
+    waited = (func.julianday(now) - func.julianday(Job.created_at)) * 86400
+    return func.max(
+        PRIORITY_LIVE, func.coalesce(Job.priority, 0) - cast(waited / AGING_SECONDS, Integer)
+    )
+
+
+def _schedule_key(candidate, usage: dict[int | None, float], now: datetime) -> tuple:
+    waited = (now - candidate.created_at).total_seconds()
+    priority = max(PRIORITY_LIVE, (candidate.priority or 0) - int(waited // AGING_SECONDS))
+    cost = DEFAULT_COST if candidate.cost is None else candidate.cost
+    return (priority, usage.get(candidate.user_id, 0.0), cost, candidate.id)
+
+
+def claim(
+    queue: str,
+    worker_id: str,
+    on_abandoned: Callable[..., None] | None = None,
+) -> Job | None:
+    """Atomically take the next runnable job on ``queue``.
+
+    A job is runnable when it is queued, or when it is running but its lease
+    has expired because the worker holding it died. Jobs are ordered by
+    priority class (raised as they wait), then by how much media each user
+    had processed recently so one user's backlog cannot starve the others,
+    then shortest media first, then age. The claim is a compare-and-set on
+    the row so two workers can never take the same job. A job claimed more
+    than ``MAX_ATTEMPTS`` times is failed instead and passed to
+    ``on_abandoned`` as ``(transcript_id, error, **payload)``, so what it was
+    working on does not stay "processing" forever.
+    """
+    db = SessionLocal()
+    try:
+        while True:
+            now = datetime.utcnow()
+            runnable = and_(
+                Job.queue == queue,
+                or_(
+                    Job.status == "queued",
+                    and_(Job.status == "running", Job.lease_expires_at < now),
+                ),
+            )
+            # Each user's best few jobs, so a long backlog cannot crowd others out of the list.
+            ranked = (
+                select(
+                    Job.id,
+                    Job.status,
+                    Job.lease_expires_at,
+                    Job.user_id,
+                    Job.priority,
+                    Job.cost,
+                    Job.created_at,
+                    func.row_number()
+                    .over(
+                        partition_by=Job.user_id,
+                        order_by=(_aged_priority(now), func.coalesce(Job.cost, DEFAULT_COST), Job.id),
+                    )
+                    .label("rank"),
+                )
+                .where(runnable)
+                .subquery()
+            )
+            candidates = db.execute(
+                select(ranked).where(ranked.c.rank <= _CANDIDATES_PER_USER)
+            ).all()
+            if not candidates:
+                return None
+            usage = _usage(db, queue, now)
+            candidate = min(candidates, key=lambda c: _schedule_key(c, usage, now))
+            job_id, status, lease = candidate.id, candidate.status, candidate.lease_expires_at
+            result = db.execute(
+                update(Job)
+                .where(
+                    Job.id == job_id,
+                    Job.status == status,
+                    Job.lease_expires_at.is_(None) if lease is None else Job.lease_expires_at == lease,
+                )
+                .values(
+                    status="running",
+                    worker_id=worker_id,
+                    attempts=Job.attempts + 1,
+                    started_at=now,
+                    lease_expires_at=now + timedelta(seconds=LEASE_SECONDS),
+                )
+            )
+            db.commit()
+            if result.rowcount != 1:
+                # Another worker won the race; look for the next candidate.
+                continue
+            job = db.get(Job, job_id)
+            if job.attempts > MAX_ATTEMPTS:
+                job.status = "failed"
+                job.error = "Exceeded maximum attempts"
+                job.finished_at = now
+                db.commit()
+                logger.warning("Job %s abandoned after %s attempts", job_id, MAX_ATTEMPTS)
+                if on_abandoned:
+                    error = f"Gave up after {MAX_ATTEMPTS} attempts; the worker stopped during each one"
+                    try:
+                        on_abandoned(job.transcript_id, error, **json.loads(job.payload or "{}"))
+                    except Exception:
+                        logger.exception("Failed to clean up after abandoned job %s", job_id)
+                continue
+            db.expunge(job)
+            return job
+    finally:
+        db.close()
+
+
+def heartbeat(job_id: int, worker_id: str) -> bool:
+    """Extend the lease of a running job; returns False if it was lost."""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.worker_id == worker_id, Job.status == "running")
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=LEASE_SECONDS))
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def finish(job_id: int, worker_id: str, error: str | None = None) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job)
+            # A cancelled job keeps its status.
+            .where(Job.id == job_id, Job.worker_id == worker_id, Job.status == "running")
+            .values(
+                status="failed" if error else "completed",
+                error=error,
+                finished_at=datetime.utcnow(),
+                lease_expires_at=None,
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def recover_stale() -> int:
+    """Requeue running jobs whose lease has already expired (e.g. after a crash)."""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(Job)
+            .where(Job.status == "running", Job.lease_expires_at < datetime.utcnow())
+            .values(status="queued", worker_id=None, lease_expires_at=None)
+        )
+        db.commit()
+        if result.rowcount:
+            logger.info("Requeued %s stale jobs", result.rowcount)
+        return result.rowcount
+    finally:
+        db.close()
+
+
+class WorkerPool:
+    """Fixed set of worker threads per queue pulling jobs from the jobs table."""
+
+    def __init__(
+        self,
+        handlers: dict[str, Callable[..., None]],
+        concurrency: dict[str, int],
+        abandoned: dict[str, Callable[..., None]] | None = None,
+    ) -> None:
+        self.handlers = handlers
+        self.concurrency = concurrency
+        # Per queue, see claim()
+        self.abandoned = abandoned or {}
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self) -> None:
+        recover_stale()
+        for queue, count in self.concurrency.items():
+            for n in range(count):
+                worker_id = f"{self._prefix}:{queue}:{n}:{uuid.uuid4().hex[:6]}"
+                thread = threading.Thread(
+                    target=self._loop, args=(queue, worker_id), name=f"worker-{queue}-{n}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info("Started workers: %s", self.concurrency)
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        with _wakeup:
+            _wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def _loop(self, queue: str, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                job = claim(queue, worker_id, self.abandoned.get(queue))
+            except Exception:
+                logger.exception("Failed to claim job from %s", queue)
+                job = None
+            if job is None:
+                with _wakeup:
+                    _wakeup.wait(POLL_SECONDS)
+                continue
+            self._run(job, worker_id)
+
+    def _run(self, job: Job, worker_id: str) -> None:
+        done = threading.Event()
+
+        def beat() -> None:
+            last_beat = time.monotonic()
+            while not done.wait(min(CANCEL_POLL_SECONDS, HEARTBEAT_SECONDS)):
+                if job_status(job.id) == "cancelled":
+                    logger.info("Job %s was cancelled", job.id)
+                    with _cancelled_lock:
+                        _cancelled[job.id] = job.transcript_id
+                    return
+                if time.monotonic() - last_beat < HEARTBEAT_SECONDS:
+                    continue
+                last_beat = time.monotonic()
+                if not heartbeat(job.id, worker_id):
+                    logger.warning("Lost lease on job %s", job.id)
+                    return
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        QUEUE_WAIT_SECONDS.labels(job.queue).observe(queue_wait(job))
+        started = time.perf_counter()
+        _local.job = job
+        error = None
+        outcome = "completed"
+        try:
+            payload = json.loads(job.payload or "{}")
+            self.handlers[job.queue](job.transcript_id, **payload)
+        except JobCancelled:
+            outcome = "cancelled"
+        except Exception as exc:
+            logger.exception("Job %s failed", job.id)
+            error = str(exc)
+            outcome = "failed"
+        finally:
+            _local.job = None
+            done.set()
+            beater.join()
+            with _cancelled_lock:
+                if job.id in _cancelled:
+                    del _cancelled[job.id]
+                    outcome = "cancelled"
+            JOB_SECONDS.labels(job.queue).observe(time.perf_counter() - started)
+            JOBS.labels(job.queue, outcome).inc()
+            finish(job.id, worker_id, error)
@@ -1,18 +1,43 @@
-from fastapi import FastAPI, Request, UploadFile, File, BackgroundTasks, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from fastapi import FastAPI, Request, UploadFile, File, Form, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from passlib.context import CryptContext
-from .db import SessionLocal, Transcript, User
-import shutil
+from .db import SessionLocal, Transcript, User, Recording, RecordingChunk, Upload, get_db, init_db
 import os
 import re
+import json
+import asyncio
+import time
+from datetime import datetime
+from sqlalchemy import LargeBinary, or_, and_, type_coerce
+from sqlalchemy.orm import Session, load_only
 
+# Only lightweight modules are imported here; the ML stack lives in app.worker.
+from .pipeline import cancel_transcription, finish_recording_if_done, hf_token_for, pipeline_signature
+from .storage import store_upload, find_transcript, media_file, probe_duration
+from .archive import stream_archive
+from . import uploads
+from .compression import encode_for
+from .segments import load_segments, copy_segments, EXPORTERS
+from .events import bus, DatabaseRelay
+from .search import search as search_transcripts, index_transcript
+from .metrics import HTTP_SECONDS, render as render_metrics
+from .jobs import (
+    enqueue,
+    has_active_job,
+    TRANSCRIBE_QUEUE,
+    LIVE_QUEUE,
+    SUMMARIZE_QUEUE,
+    DECODE_QUEUE,
+    PRIORITY_LIVE,
+    PRIORITY_NORMAL,
+    PRIORITY_BULK,
+)
 
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "data")
-
-from .transcribe import transcribe_file, summarize_record
+init_db()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -22,57 +47,354 @@ app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__
 
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
 
-def get_current_user(request: Request):
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+# Run the job workers inside the web process instead of `python -m app.worker`.
+EMBEDDED_WORKERS = os.getenv("EMBEDDED_WORKERS", "false").lower() in ("1", "true", "yes")
+
+
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, to keep the series bounded.
+    route = request.scope.get("route")
+    HTTP_SECONDS.labels(
+        request.method, route.path if route else "other", response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+
+workers = None
+relay = DatabaseRelay(bus)
+
+
+@app.on_event("startup")
+def start_background():
+    global workers
+    if EMBEDDED_WORKERS:
+        # Jobs publish to this process's bus directly; importing the worker loads the ML stack.
+        from .worker import start as start_workers
+
+        workers = start_workers()
+    else:
+        relay.start()
+
+
+@app.on_event("shutdown")
+def stop_background():
+    if workers:
+        workers.stop()
+    relay.stop()
+
+
+def get_current_user(request: Request, db: Session = Depends(get_db)):
     user_id = request.session.get("user_id")
     if not user_id:
         return None
-    db = SessionLocal()
-    user = db.get(User, user_id)
-    db.close()
-    return user
+    return db.get(User, user_id)
 
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request):
-    user = get_current_user(request)
-    db = SessionLocal()
-    query = db.query(Transcript)
+def index(
+    request: Request,
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    # Only the list columns are loaded; full text is fetched by the modal on demand.
+    query = db.query(Transcript).options(
+        load_only(
+            Transcript.id,
+            Transcript.filename,
+            Transcript.status,
+            Transcript.content_hash,
+            Transcript.result_snippet,
+            Transcript.summary_snippet,
+            Transcript.summary_status,
+            Transcript.created_at,
+        )
+    )
     if user:
         query = query.filter(Transcript.user_id == user.id)
-    files = query.order_by(Transcript.created_at.desc()).all()
-    db.close()
-    return templates.TemplateResponse("index.html", {"request": request, "files": files, "user": user})
+    if cursor:
+        try:
+            ts, cursor_id = cursor.rsplit("_", 1)
+            ts, cursor_id = datetime.fromisoformat(ts), int(cursor_id)
+        except ValueError:
+            return RedirectResponse("/", status_code=302)
+        query = query.filter(
+            or_(
+                Transcript.created_at < ts,
+                and_(Transcript.created_at == ts, Transcript.id < cursor_id),
+            )
+        )
+    files = (
+        query.order_by(Transcript.created_at.desc(), Transcript.id.desc())
+        .limit(PAGE_SIZE + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(files) > PAGE_SIZE:
+        files = files[:PAGE_SIZE]
+        last = files[-1]
+        next_cursor = f"{last.created_at.isoformat()}_{last.id}"
+    return templates.TemplateResponse(
+        "index.html",
+        {"request": request, "files": files, "user": user, "next_cursor": next_cursor},
+    )
+
+def _sanitize_filename(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(name))
+
+
+def _priority(name: str) -> int:
+    # Clients may lower their own priority; the live class is reserved for recordings.
+    return PRIORITY_BULK if name == "bulk" else PRIORITY_NORMAL
+
 
 @app.post("/upload", response_class=HTMLResponse)
-def upload_file(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    db = SessionLocal()
-    filename = os.path.basename(file.filename)
-    filename = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    user = get_current_user(request)
-    record = Transcript(filename=filename, user_id=user.id if user else None)
+def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    priority: str = Form("normal"),
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    filename = _sanitize_filename(file.filename)
+    content_hash, file_path = store_upload(file.file)
+    pipeline = pipeline_signature(hf_token_for(user))
+    record = Transcript(
+        filename=filename,
+        user_id=user.id if user else None,
+        content_hash=content_hash,
+        pipeline=pipeline,
+    )
+    existing = find_transcript(db, content_hash, pipeline)
+    if existing:
+        record.status = "completed"
+        record.result = existing.result
+        record.progress = 100
     db.add(record)
     db.commit()
     db.refresh(record)
-    background_tasks.add_task(transcribe_file, record.id, file_path)
-    db.close()
+    if existing:
+        copy_segments(db, existing.id, record.id)
+        db.flush()
+        index_transcript(db, record)
+        db.commit()
+    if not existing:
+        enqueue(
+            TRANSCRIBE_QUEUE,
+            record.id,
+            user_id=record.user_id,
+            priority=_priority(priority),
+            cost=probe_duration(file_path),
+            file_path=file_path,
+        )
     return templates.TemplateResponse("upload_success.html", {"request": request, "filename": filename, "file_id": record.id})
 
+def _upload_state(db: Session, upload: Upload) -> dict:
+    return {
+        "upload_id": upload.id,
+        "transcript_id": upload.transcript_id,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "chunks": uploads.chunk_count(upload),
+        "status": upload.status,
+        "received": uploads.received(db, upload.id),
+    }
+
+
+def _own_upload(db: Session, upload_id: int, user: User | None) -> Upload | None:
+    upload = db.get(Upload, upload_id)
+    if not upload or upload.user_id != (user.id if user else None):
+        return None
+    return upload
+
+
+@app.post("/api/uploads")
+def upload_create(
+    filename: str = Form(...),
+    size: int = Form(...),
+    priority: str = Form("normal"),
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    """Start a resumable upload; chunks are then PUT to ``/api/uploads/{id}/chunks/{seq}``."""
+    if size <= 0 or size > uploads.MAX_BYTES:
+        return Response(status_code=413)
+    uploads.expire_uploads(db)
+    filename = _sanitize_filename(filename)
+    upload = uploads.create_upload(db, user.id if user else None, filename, size, _priority(priority))
+    db.commit()
+    if uploads.is_streamable(filename):
+        # Decodes the received prefix while the rest is still uploading; it has
+        # its own workers, so a slow upload never holds up transcription.
+        enqueue(DECODE_QUEUE, upload.transcript_id, user_id=upload.user_id, upload_id=upload.id)
+    return _upload_state(db, upload)
+
+
+@app.get("/api/uploads/{upload_id}")
+def upload_state(upload_id: int, db: Session = Depends(get_db), user: User | None = Depends(get_current_user)):
+    """Which chunks have arrived, so an interrupted upload can send only the rest."""
+    upload = _own_upload(db, upload_id, user)
+    if not upload:
+        return Response(status_code=404)
+    return _upload_state(db, upload)
+
+
+@app.put("/api/uploads/{upload_id}/chunks/{seq}")
+async def upload_chunk(
+    upload_id: int,
+    seq: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    """Write one chunk. ``X-Chunk-SHA256``, if sent, must match what arrived."""
+    upload = await run_in_threadpool(_own_upload, db, upload_id, user)
+    if not upload:
+        return Response(status_code=404)
+    if upload.status != "uploading":
+        return Response(status_code=409)
+    if not 0 <= seq < uploads.chunk_count(upload):
+        return Response(status_code=416)
+    length, digest = await uploads.write_chunk(upload, seq, request.stream())
+    expected = request.headers.get("x-chunk-sha256", "").lower()
+    if length != uploads.chunk_length(upload, seq) or (expected and expected != digest):
+        await run_in_threadpool(uploads.discard_chunk, db, upload.id, seq)
+        return Response(f"chunk {seq} is damaged or incomplete; send it again", status_code=422)
+    await run_in_threadpool(uploads.record_chunk, db, upload.id, seq, digest)
+    return {"seq": seq, "sha256": digest}
+
+
+@app.post("/api/uploads/{upload_id}/complete")
+def upload_complete(upload_id: int, db: Session = Depends(get_db), user: User | None = Depends(get_current_user)):
+    upload = _own_upload(db, upload_id, user)
+    if not upload:
+        return Response(status_code=404)
+    if upload.status == "uploading":
+        missing = sorted(set(range(uploads.chunk_count(upload))) - set(uploads.received(db, upload.id)))
+        if missing:
+            return JSONResponse({"missing": missing}, status_code=409)
+        uploads.complete_upload(db, upload)
+        record = db.get(Transcript, upload.transcript_id)
+        # The worker stores the file and picks up audio the decode job produced.
+        if record.status != "completed" and not has_active_job(TRANSCRIBE_QUEUE, record.id):
+            enqueue(
+                TRANSCRIBE_QUEUE,
+                record.id,
+                user_id=record.user_id,
+                priority=upload.priority,
+                cost=probe_duration(upload.path),
+                file_path=upload.path,
+                upload_id=upload.id,
+            )
+    elif upload.status not in ("complete", "stored"):
+        return Response(status_code=409)
+    return _upload_state(db, upload)
+
+
+@app.get("/record", response_class=HTMLResponse)
+def record_page(request: Request, user: User | None = Depends(get_current_user)):
+    return templates.TemplateResponse("record.html", {"request": request, "user": user})
+
+
+@app.post("/api/record")
+def record_chunk(
+    file: UploadFile = File(...),
+    session: int | None = Form(None),
+    seq: int = Form(0),
+    start: float | None = Form(None),
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    """Accept one chunk of a live recording and queue it for transcription.
+
+    The first chunk (without ``session``) starts a recording. Each chunk must be
+    a self-contained media file; ``start`` is its offset in seconds from the
+    start of the recording, if the client knows it.
+    """
+    user_id = user.id if user else None
+    if session is None:
+        record = Transcript(
+            filename=f"recording-{datetime.utcnow():%Y%m%d-%H%M%S}",
+            user_id=user_id,
+            status="processing",
+            stage="asr",
+        )
+        db.add(record)
+        db.flush()
+        recording = Recording(user_id=user_id, transcript_id=record.id)
+        db.add(recording)
+        db.flush()
+    else:
+        recording = db.get(Recording, session)
+        if not recording or recording.user_id != user_id:
+            return Response(status_code=404)
+        if recording.status != "recording":
+            return Response(status_code=409)
+    _, path = store_upload(file.file)
+    chunk = RecordingChunk(recording_id=recording.id, seq=seq, path=path, offset=start)
+    db.add(chunk)
+    db.commit()
+    enqueue(LIVE_QUEUE, recording.transcript_id, user_id=user_id, priority=PRIORITY_LIVE, chunk_id=chunk.id)
+    return {"session": recording.id, "transcript_id": recording.transcript_id, "seq": seq}
+
+
+@app.post("/api/record/{session}/stop")
+def record_stop(
+    session: int,
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    recording = db.get(Recording, session)
+    if not recording or recording.user_id != (user.id if user else None):
+        return Response(status_code=404)
+    if recording.status == "recording":
+        recording.status = "stopped"
+        db.commit()
+    # Usually chunks are still in flight; the last one to finish completes the transcript.
+    finish_recording_if_done(db, recording.id)
+    return {"session": recording.id, "transcript_id": recording.transcript_id, "status": recording.status}
+
+
+@app.get("/search", response_class=HTMLResponse)
+def search_page(
+    request: Request,
+    q: str = "",
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    hits = search_transcripts(db, q, user.id if user else None) if q else []
+    return templates.TemplateResponse("search.html", {"request": request, "user": user, "q": q, "hits": hits})
+
+
+@app.get("/api/search")
+def search_api(
+    q: str,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    hits = search_transcripts(db, q, user.id if user else None, limit=min(limit, 200))
+    return {"hits": hits}
+
+
 @app.get("/login", response_class=HTMLResponse)
 def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @app.post("/login", response_class=HTMLResponse)
-def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    db = SessionLocal()
+def login(
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: Session = Depends(get_db),
+):
     user = db.query(User).filter_by(username=username).first()
     if user and pwd_context.verify(password, user.password_hash):
         request.session["user_id"] = user.id
-        db.close()
         return RedirectResponse("/", status_code=302)
-    db.close()
     return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid credentials"})
 
 @app.get("/register", response_class=HTMLResponse)
@@ -80,18 +402,20 @@ def register_form(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 @app.post("/register", response_class=HTMLResponse)
-def register(request: Request, username: str = Form(...), password: str = Form(...)):
-    db = SessionLocal()
+def register(
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: Session = Depends(get_db),
+):
     existing = db.query(User).filter_by(username=username).first()
     if existing:
-        db.close()
         return templates.TemplateResponse("register.html", {"request": request, "error": "Username taken"})
     user = User(username=username, password_hash=pwd_context.hash(password))
     db.add(user)
     db.commit()
     db.refresh(user)
     request.session["user_id"] = user.id
-    db.close()
     return RedirectResponse("/", status_code=302)
 
 @app.get("/logout")
@@ -100,8 +424,7 @@ def logout(request: Request):
     return RedirectResponse("/", status_code=302)
 
 @app.get("/settings", response_class=HTMLResponse)
-def settings_form(request: Request):
-    user = get_current_user(request)
+def settings_form(request: Request, user: User | None = Depends(get_current_user)):
     if not user:
         return RedirectResponse("/login", status_code=302)
     return templates.TemplateResponse("settings.html", {"request": request, "user": user})
@@ -113,70 +436,262 @@ def settings_save(
     openai_token: str = Form(""),
     ollama_url: str = Form(""),
     ollama_model: str = Form(""),
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
 ):
-    user = get_current_user(request)
     if not user:
         return RedirectResponse("/login", status_code=302)
-    db = SessionLocal()
-    db_user = db.get(User, user.id)
-    db_user.hf_token = hf_token
-    db_user.openai_token = openai_token
-    db_user.ollama_url = ollama_url
-    db_user.ollama_model = ollama_model
+    user.hf_token = hf_token
+    user.openai_token = openai_token
+    user.ollama_url = ollama_url
+    user.ollama_model = ollama_model
     db.commit()
-    db.refresh(db_user)
-    db.close()
-    return templates.TemplateResponse("settings.html", {"request": request, "user": db_user, "success": True})
+    db.refresh(user)
+    return templates.TemplateResponse("settings.html", {"request": request, "user": user, "success": True})
+
+
+_STATUS_COLUMNS = (
+    Transcript.id,
+    Transcript.status,
+    Transcript.stage,
+    Transcript.progress,
+    Transcript.summary_status,
+)
+
+
+def _status_dict(row) -> dict:
+    return {
+        "status": row.status,
+        "stage": row.stage,
+        "progress": row.progress or 0,
+        "summary_status": row.summary_status,
+    }
+
+
+@app.get("/status")
+def status_batch(
+    ids: str = "",
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    """Status of several transcripts at once, reading only the status columns."""
+    try:
+        wanted = [int(i) for i in ids.split(",") if i][:500]
+    except ValueError:
+        return Response(status_code=400)
+    query = db.query(*_STATUS_COLUMNS).filter(Transcript.id.in_(wanted))
+    query = query.filter(Transcript.user_id == (user.id if user else None))
+    rows = query.all()
+    return {str(row.id): _status_dict(row) for row in rows}
 
 
 @app.get("/status/{file_id}")
-def status(file_id: int):
-    db = SessionLocal()
+def status(file_id: int, db: Session = Depends(get_db)):
+    row = db.query(*_STATUS_COLUMNS).filter(Transcript.id == file_id).first()
+    if not row:
+        return {"status": "unknown"}
+    return _status_dict(row)
+
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/metrics/{file_id}")
+def transcript_metrics(file_id: int, db: Session = Depends(get_db)):
+    """Stage timings, real-time factor and peak memory of a transcript's last run."""
+    row = db.query(Transcript.metrics).filter(Transcript.id == file_id).first()
+    if not row or not row.metrics:
+        return Response(status_code=404)
+    return json.loads(row.metrics)
+
+
+@app.get("/events")
+async def events(request: Request, user: User | None = Depends(get_current_user)):
+    """Server-sent events with progress for all of the current user's jobs."""
+    user_id = user.id if user else None
+    queue = bus.subscribe(user_id)
+
+    def snapshot() -> list[dict]:
+        db = SessionLocal()
+        query = db.query(*_STATUS_COLUMNS).filter(
+            or_(
+                Transcript.status.in_(("pending", "processing")),
+                Transcript.summary_status == "processing",
+            )
+        )
+        query = query.filter(Transcript.user_id == user_id)
+        rows = query.all()
+        db.close()
+        return [{"id": row.id, **_status_dict(row)} for row in rows]
+
+    async def stream():
+        try:
+            for event in await run_in_threadpool(snapshot):
+                yield f"data: {json.dumps(event)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            bus.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
+
+
+@app.get("/text/{file_id}")
+def full_text(request: Request, file_id: int, kind: str = "result", db: Session = Depends(get_db)):
+    if kind not in ("result", "summary"):
+        return Response(status_code=400)
+    stored = _stored_text(db, file_id, kind)
+    if stored is None:
+        return Response(status_code=404)
+    return _text_response(request, stored[1])
+
+
+@app.get("/segments/{file_id}")
+def segments(
+    file_id: int,
+    start: float | None = None,
+    end: float | None = None,
+    words: bool = False,
+    db: Session = Depends(get_db),
+):
+    items = load_segments(db, file_id, start, end, with_words=words)
+    return {"segments": items}
+
+
+@app.get("/export/{file_id}.{fmt}")
+def export(file_id: int, fmt: str, db: Session = Depends(get_db)):
+    if fmt not in EXPORTERS:
+        return Response(status_code=404)
     record = db.get(Transcript, file_id)
     if not record:
-        db.close()
-        return {"status": "unknown"}
-    status = record.status
-    db.close()
-    return {"status": status}
+        return RedirectResponse("/", status_code=302)
+    filename = f"{record.filename}.{fmt}"
+    items = load_segments(db, file_id, with_words=fmt == "json")
+    render, media_type = EXPORTERS[fmt]
+    return Response(render(items), media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
+def _stored_text(db: Session, file_id: int, kind: str):
+    """``(filename, stored bytes)`` of a transcript's result or summary, still compressed."""
+    column = type_coerce(getattr(Transcript, kind), LargeBinary)
+    row = db.query(Transcript.filename, column).filter(Transcript.id == file_id).first()
+    if not row or row[1] is None:
+        return None
+    return row
+
+
+def _text_response(request: Request, stored: bytes, filename: str | None = None) -> StreamingResponse:
+    # Stored frames go out as they are when the client can decode them.
+    body, encoding = encode_for(stored, request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if filename:
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return StreamingResponse(body, media_type="text/plain; charset=utf-8", headers=headers)
 
 
 @app.get("/download/{file_id}")
-def download_text(file_id: int):
-    db = SessionLocal()
-    record = db.get(Transcript, file_id)
-    if not record or not record.result:
-        db.close()
+def download_text(request: Request, file_id: int, db: Session = Depends(get_db)):
+    stored = _stored_text(db, file_id, "result")
+    if not stored or not stored[1]:
         return RedirectResponse("/", status_code=302)
-    text = record.result
-    filename = f"{record.filename}.txt"
-    db.close()
-    return Response(text, media_type="text/plain", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    return _text_response(request, stored[1], f"{stored[0]}.txt")
 
 
 @app.get("/download_summary/{file_id}")
-def download_summary(file_id: int):
-    db = SessionLocal()
+def download_summary(request: Request, file_id: int, db: Session = Depends(get_db)):
+    stored = _stored_text(db, file_id, "summary")
+    if not stored or not stored[1]:
+        return RedirectResponse("/", status_code=302)
+    return _text_response(request, stored[1], f"{stored[0]}_summary.txt")
+
+
+@app.get("/archive.zip")
+def download_archive(
+    ids: str = "",
+    db: Session = Depends(get_db),
+    user: User | None = Depends(get_current_user),
+):
+    """ZIP of transcripts, subtitles, summaries and audio; all completed transcripts without ``ids``."""
+    query = db.query(Transcript.id).filter(Transcript.status == "completed")
+    if ids:
+        try:
+            wanted = [int(i) for i in ids.split(",") if i]
+        except ValueError:
+            return Response(status_code=400)
+        query = query.filter(Transcript.id.in_(wanted))
+    # Anonymous visitors only get anonymous uploads, like search.
+    query = query.filter(Transcript.user_id == (user.id if user else None))
+    transcript_ids = [row.id for row in query.order_by(Transcript.id)]
+    if not transcript_ids:
+        return Response(status_code=404)
+    filename = f"4ears-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"
+    return StreamingResponse(
+        stream_archive(transcript_ids),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@app.post("/cancel/{file_id}")
+def cancel(file_id: int, db: Session = Depends(get_db), user: User | None = Depends(get_current_user)):
+    """Cancel a queued or running transcription."""
     record = db.get(Transcript, file_id)
-    if not record or not record.summary:
-        db.close()
+    if not record or record.user_id != (user.id if user else None):
+        return Response(status_code=404)
+    cancel_transcription(db, record)
+    return RedirectResponse("/", status_code=302)
+
+
+@app.post("/retranscribe/{file_id}")
+def retranscribe(file_id: int, db: Session = Depends(get_db), user: User | None = Depends(get_current_user)):
+    """Run a finished transcription again, e.g. after adding a Hugging Face token.
+
+    The worker reuses the stored artifacts of every stage whose inputs did not change.
+    """
+    record = db.get(Transcript, file_id)
+    if not record or record.user_id != (user.id if user else None):
+        return Response(status_code=404)
+    if (
+        not record.content_hash
+        or record.status in ("pending", "processing")
+        or has_active_job(TRANSCRIBE_QUEUE, record.id)
+    ):
         return RedirectResponse("/", status_code=302)
-    text = record.summary
-    filename = f"{record.filename}_summary.txt"
-    db.close()
-    return Response(text, media_type="text/plain", headers={"Content-Disposition": f"attachment; filename={filename}"})
+    path = media_file(record.content_hash, record.media_path)
+    if not path:
+        # The media was removed since; nothing to transcribe from.
+        return RedirectResponse("/", status_code=302)
+    record.status = "pending"
+    record.progress = 0
+    db.commit()
+    enqueue(
+        TRANSCRIBE_QUEUE,
+        record.id,
+        user_id=record.user_id,
+        cost=probe_duration(path),
+        file_path=path,
+    )
+    return RedirectResponse("/", status_code=302)
 
 
 @app.post("/summarize/{file_id}")
-def summarize(file_id: int, background_tasks: BackgroundTasks, mode: str = Form("basic_summary")):
-    db = SessionLocal()
+def summarize(file_id: int, mode: str = Form("basic_summary"), db: Session = Depends(get_db)):
     record = db.get(Transcript, file_id)
     if not record or not record.result:
-        db.close()
         return RedirectResponse("/", status_code=302)
-    if record.summary_status == "processing":
-        db.close()
+    if record.summary_status == "processing" or has_active_job(SUMMARIZE_QUEUE, record.id):
         return RedirectResponse("/", status_code=302)
-    background_tasks.add_task(summarize_record, record.id, mode)
-    db.close()
+    enqueue(SUMMARIZE_QUEUE, record.id, user_id=record.user_id, mode=mode)
     return RedirectResponse("/", status_code=302)
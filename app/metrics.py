@@ -0,0 +1,117 @@
+import os
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+RSS_SAMPLE_SECONDS = float(os.getenv("METRICS_RSS_SAMPLE_SECONDS", "0.5"))
+
+_STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+_MB = 1024 * 1024
+
+STAGE_SECONDS = Histogram(
+    "fourears_stage_seconds", "Time spent in each pipeline stage", ["queue", "stage"], buckets=_STAGE_BUCKETS
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "fourears_model_load_seconds", "Time to load a model into memory", ["kind"], buckets=_STAGE_BUCKETS
+)
+REAL_TIME_FACTOR = Histogram(
+    "fourears_real_time_factor",
+    "Processing time divided by audio duration",
+    ["queue"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10),
+)
+PEAK_RSS_BYTES = Histogram(
+    "fourears_job_peak_rss_bytes",
+    "Peak resident memory of the worker process during a job",
+    ["queue"],
+    buckets=tuple(2**i * _MB for i in range(7, 16)),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "fourears_queue_wait_seconds", "Time from enqueue until a worker claimed the job", ["queue"],
+    buckets=_STAGE_BUCKETS,
+)
+JOB_SECONDS = Histogram("fourears_job_seconds", "Time a worker spent on a job", ["queue"], buckets=_STAGE_BUCKETS)
+JOBS = Counter("fourears_jobs", "Finished jobs", ["queue", "outcome"])
+HTTP_SECONDS = Histogram(
+    "fourears_http_request_duration_seconds",
+    "Web request latency until the response starts",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+def render() -> tuple[bytes, str]:
+    """Return the Prometheus exposition of all metrics and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Without /proc only the process high-water mark is known (KiB on Linux).
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class JobMetrics:
+    """Stage timings, real-time factor and peak memory of one pipeline run.
+
+    Entering a stage twice adds up, so ``model_load`` covers every model a job
+    had to wait for. Memory is sampled for the whole worker process, which
+    jobs running side by side in it share.
+    """
+
+    def __init__(self, queue: str) -> None:
+        self.queue = queue
+        self.stages: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._peak_rss = _rss_bytes()
+        self._summary: dict | None = None
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            self._peak_rss = max(self._peak_rss, _rss_bytes())
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            # Stages may run concurrently in different threads.
+            with self._lock:
+                self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+            STAGE_SECONDS.labels(self.queue, stage).observe(elapsed)
+
+    def finish(self, audio_seconds: float | None = None, queue_wait: float | None = None) -> dict:
+        """Stop sampling, record the job-level metrics and return them for storage."""
+        if self._summary is not None:
+            return self._summary
+        self._done.set()
+        self._sampler.join()
+        self._peak_rss = max(self._peak_rss, _rss_bytes())
+        wall = time.perf_counter() - self._started
+        PEAK_RSS_BYTES.labels(self.queue).observe(self._peak_rss)
+        summary = {
+            "wall_seconds": round(wall, 3),
+            "stages": {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            "peak_rss_mb": round(self._peak_rss / _MB, 1),
+        }
+        if audio_seconds:
+            summary["audio_seconds"] = round(audio_seconds, 3)
+            summary["real_time_factor"] = round(wall / audio_seconds, 4)
+            REAL_TIME_FACTOR.labels(self.queue).observe(wall / audio_seconds)
+        if queue_wait is not None:
+            summary["queue_wait_seconds"] = round(queue_wait, 3)
+        self._summary = summary
+        return summary
@@ -0,0 +1,152 @@
+import os
+import gc
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import whisperx
+
+from .metrics import MODEL_LOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEVICE = "cpu"
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "6144"))
+
+# Rough resident sizes used for budgeting; exact numbers are not important,
+# they only need to rank models so that eviction frees enough memory.
+_ASR_SIZE_MB = {
+    "tiny": 200,
+    "base": 400,
+    "small": 1000,
+    "medium": 2600,
+    "large-v2": 4800,
+    "large-v3": 4800,
+}
+_ALIGN_SIZE_MB = 400
+_DIARIZE_SIZE_MB = 700
+
+
+class ModelRegistry:
+    """LRU cache of loaded models bounded by an approximate memory budget."""
+
+    def __init__(self, budget_mb: int) -> None:
+        self.budget_mb = budget_mb
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._key_locks: dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get(self, key: Hashable, loader: Callable[[], Any], size_mb: int) -> Any:
+        """Return the model for ``key``, loading it with ``loader`` on a miss."""
+        with self._lock:
+            model = self._lookup(key)
+            if model is not None:
+                return model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so that different models can load in
+        # parallel, while concurrent requests for the same key wait for one load.
+        with key_lock:
+            with self._lock:
+                model = self._lookup(key)
+                if model is not None:
+                    return model
+            logger.info("Loading %s model", key[0])
+            started = time.perf_counter()
+            model = loader()
+            MODEL_LOAD_SECONDS.labels(key[0]).observe(time.perf_counter() - started)
+            with self._lock:
+                self._entries[key] = (model, size_mb)
+                self._evict()
+            return model
+
+    def _evict(self) -> None:
+        evicted = False
+        while len(self._entries) > 1 and self.used_mb() > self.budget_mb:
+            key, _ = self._entries.popitem(last=False)
+            self._key_locks.pop(key, None)
+            logger.info("Evicting %s model", key[0])
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def used_mb(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._key_locks.clear()
+        gc.collect()
+
+
+registry = ModelRegistry(MODEL_MEMORY_BUDGET_MB)
+
+
+def _asr_size_mb(size: str, compute_type: str) -> int:
+    # Quantized weights are a quarter of float32, but activations do not shrink,
+    # so a quantized model's footprint is estimated at half.
+    size_mb = _ASR_SIZE_MB.get(size, 2000)
+    return size_mb // 2 if compute_type.startswith("int8") else size_mb
+
+
+def get_asr_model(
+    size: str, compute_type: str, language: str | None = None, threads: int = 4
+):
+    return registry.get(
+        ("asr", size, compute_type, language, threads),
+        lambda: whisperx.load_model(
+            size,
+            device=DEVICE,
+            compute_type=compute_type,
+            language=language,
+            threads=threads,
+        ),
+        _asr_size_mb(size, compute_type),
+    )
+
+
+def get_align_model(language: str):
+    """Return ``(model, metadata)`` for the alignment model of ``language``."""
+    return registry.get(
+        ("align", language),
+        lambda: whisperx.load_align_model(language_code=language, device=DEVICE),
+        _ALIGN_SIZE_MB,
+    )
+
+
+def get_diarize_model(hf_token: str):
+    return registry.get(
+        ("diarize", hf_token),
+        lambda: whisperx.diarize.DiarizationPipeline(
+            use_auth_token=hf_token, device=DEVICE
+        ),
+        _DIARIZE_SIZE_MB,
+    )
+
+
+def warm_up(
+    size: str = "base",
+    compute_type: str = "int8",
+    threads: int = 4,
+    languages: list[str] | None = None,
+    hf_token: str | None = None,
+) -> None:
+    """Preload the models most jobs will need so the first upload is fast."""
+    try:
+        get_asr_model(size, compute_type, threads=threads)
+        for language in languages or ["en"]:
+            get_align_model(language)
+        if hf_token:
+            get_diarize_model(hf_token)
+    except Exception:
+        logger.exception("Model warm-up failed")
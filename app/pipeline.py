@@ -0,0 +1,138 @@
+"""Job bookkeeping shared by the web and worker processes.
+
+Nothing here may import the ML stack: the web process uses these helpers to
+deduplicate uploads and finish live recordings without loading WhisperX.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, Transcript, TranscriptChunk, Recording, RecordingChunk, Upload, UploadChunk, User
+from .events import publish_progress
+from .jobs import TRANSCRIBE_QUEUE, LIVE_QUEUE, DECODE_QUEUE, cancel, raise_if_cancelled
+from .runtime import PROFILE
+from .search import index_transcript
+
+# Overall progress (percent) at which each stage starts.
+STAGE_PROGRESS = {"decode": 0, "asr": 5, "align": 80, "diarize": 90, "completed": 100}
+
+
+def hf_token_for(user: User | None) -> str | None:
+    return (user.hf_token if user and user.hf_token else os.getenv("HF_TOKEN", "")) or None
+
+
+def pipeline_signature(hf_token: str | None) -> str:
+    """Describe the settings that affect transcript output, for result reuse."""
+    # Threads and batch size change speed, not output.
+    return f"{PROFILE.model_size}/{PROFILE.compute_type}/{'diarize' if hf_token else 'plain'}"
+
+
+def set_stage(db: Session, record: Transcript, stage: str, progress: int | None = None) -> None:
+    """Record progress; also where a cancelled transcription stops (raises ``JobCancelled``)."""
+    raise_if_cancelled(record.id)
+    record.stage = stage
+    record.progress = STAGE_PROGRESS[stage] if progress is None else progress
+    db.commit()
+    publish_progress(
+        record.id, record.user_id, status=record.status, stage=stage, progress=record.progress
+    )
+
+
+def finish_recording_if_done(db: Session, recording_id: int) -> bool:
+    """Complete the transcript of a stopped recording once all its chunks are processed."""
+    recording = db.get(Recording, recording_id)
+    if not recording or recording.status != "stopped":
+        return False
+    pending = (
+        db.query(RecordingChunk)
+        .filter(
+            RecordingChunk.recording_id == recording_id,
+            RecordingChunk.status.in_(("queued", "processing")),
+        )
+        .count()
+    )
+    if pending:
+        return False
+    record = db.get(Transcript, recording.transcript_id)
+    recording.status = "finished"
+    recording.finished_at = datetime.utcnow()
+    record.status = "completed"
+    index_transcript(db, record)
+    set_stage(db, record, "completed")
+    return True
+
+
+def abandon_transcription(transcript_id: int, error: str, **payload) -> None:
+    """Fail a transcript whose job was given up on; see ``jobs.claim``."""
+    db = SessionLocal()
+    try:
+        record = db.get(Transcript, transcript_id)
+        if not record or record.status not in ("pending", "processing"):
+            return
+        record.status = "failed"
+        record.result = error
+        db.commit()
+        publish_progress(record.id, record.user_id, status="failed", stage=record.stage)
+    finally:
+        db.close()
+
+
+def abandon_summary(transcript_id: int, error: str, **payload) -> None:
+    """Fail a summary whose job was given up on, so it can be requested again."""
+    db = SessionLocal()
+    try:
+        record = db.get(Transcript, transcript_id)
+        if not record or record.summary_status != "processing":
+            return
+        record.summary_status = "failed"
+        record.summary = error
+        db.commit()
+        publish_progress(record.id, record.user_id, status=record.status, summary_status="failed")
+    finally:
+        db.close()
+
+
+def abandon_recording_chunk(transcript_id: int, error: str, chunk_id: int, **payload) -> None:
+    """Skip a live chunk whose job was given up on, so the recording can still finish."""
+    db = SessionLocal()
+    try:
+        chunk = db.get(RecordingChunk, chunk_id)
+        if not chunk or chunk.status not in ("queued", "processing"):
+            return
+        chunk.status = "failed"
+        db.commit()
+        finish_recording_if_done(db, chunk.recording_id)
+        db.commit()
+    finally:
+        db.close()
+
+
+def cancel_transcription(db: Session, record: Transcript) -> bool:
+    """Cancel a transcript's queued and running transcription and clean up after it.
+
+    Returns False if there was nothing left to cancel. Commits.
+    """
+    if record.status not in ("pending", "processing"):
+        return False
+    cancel(record.id, (TRANSCRIBE_QUEUE, LIVE_QUEUE, DECODE_QUEUE))
+    record.status = "cancelled"
+    db.query(TranscriptChunk).filter(TranscriptChunk.transcript_id == record.id).delete()
+    unstored = db.query(Upload).filter(
+        Upload.transcript_id == record.id, Upload.status.in_(("uploading", "complete"))
+    )
+    for upload in unstored:
+        upload.status = "cancelled"
+        db.query(UploadChunk).filter(UploadChunk.upload_id == upload.id).delete()
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+    for recording in db.query(Recording).filter(Recording.transcript_id == record.id):
+        if recording.status != "finished":
+            recording.status = "cancelled"
+            recording.finished_at = datetime.utcnow()
+        db.query(RecordingChunk).filter(
+            RecordingChunk.recording_id == recording.id, RecordingChunk.status == "queued"
+        ).update({"status": "cancelled"})
+    db.commit()
+    publish_progress(record.id, record.user_id, status="cancelled", stage=record.stage, progress=record.progress)
+    return True
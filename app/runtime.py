@@ -0,0 +1,60 @@
+"""ASR runtime settings for this deployment.
+
+Settings are resolved per field, first match wins: environment variables
+(``MODEL_SIZE``, ``ASR_COMPUTE_TYPE``, ``ASR_THREADS``, ``ASR_BATCH_SIZE``),
+then the profile saved by ``python -m app.autotune``, then defaults for the
+local CPU.
+"""
+import os
+import json
+import logging
+from dataclasses import dataclass, asdict, fields
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PATH = os.getenv(
+    "RUNTIME_PROFILE", os.path.join(os.path.dirname(__file__), "data", "runtime_profile.json")
+)
+
+ENV_VARS = {
+    "model_size": ("MODEL_SIZE", str),
+    "compute_type": ("ASR_COMPUTE_TYPE", str),
+    "threads": ("ASR_THREADS", int),
+    "batch_size": ("ASR_BATCH_SIZE", int),
+}
+
+
+@dataclass(frozen=True)
+class RuntimeProfile:
+    model_size: str = "base"
+    # int8 is several times faster than float32 on CPU at nearly the same accuracy.
+    compute_type: str = "int8"
+    threads: int = os.cpu_count() or 4
+    batch_size: int = 8
+
+
+def load_profile(path: str = PROFILE_PATH) -> RuntimeProfile:
+    values = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as fh:
+                saved = json.load(fh)
+            values.update({f.name: saved[f.name] for f in fields(RuntimeProfile) if f.name in saved})
+        except (OSError, ValueError):
+            logger.exception("Ignoring unreadable runtime profile %s", path)
+    for name, (var, cast) in ENV_VARS.items():
+        if os.getenv(var):
+            values[name] = cast(os.environ[var])
+    return RuntimeProfile(**values)
+
+
+def save_profile(profile: RuntimeProfile, path: str = PROFILE_PATH, **extra) -> None:
+    """Write ``profile`` (plus any benchmark details in ``extra``) for later runs to pick up."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump({**asdict(profile), **extra}, fh, indent=2)
+    os.replace(tmp, path)
+
+
+PROFILE = load_profile()
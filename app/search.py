@@ -0,0 +1,166 @@
+import re
+import html
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, Segment, Transcript, engine
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH = 200
+_ROWS_PER_TRANSCRIPT = 1 << 20
+_MARK_START, _MARK_END = "\x02", "\x03"
+_LINE_START = re.compile(r"^\[(\d+(?:\.\d+)?)s - ")
+
+def enabled() -> bool:
+    # The search_index FTS5 table is created by the schema migrations in ``db``.
+    return engine.dialect.name == "sqlite"
+
+
+# ``owner`` is an indexed column holding a per-user token, so user scoping is
+# resolved inside the FTS index instead of filtering matches afterwards.
+def _owner(user_id: int | None) -> str:
+    return f"u{user_id}" if user_id is not None else "anon"
+
+
+def _rowids(transcript_id: int, kind: str) -> tuple[int, int]:
+    # Each transcript owns a fixed rowid range (segments first, summary last)
+    # so its rows can be replaced with a rowid range delete instead of a scan.
+    base = transcript_id * _ROWS_PER_TRANSCRIPT
+    if kind == "summary":
+        return base + _ROWS_PER_TRANSCRIPT - 1, base + _ROWS_PER_TRANSCRIPT - 1
+    return base, base + _ROWS_PER_TRANSCRIPT - 2
+
+
+def _replace(db: Session, transcript_id: int, kind: str, rows: list[dict]) -> None:
+    lo, hi = _rowids(transcript_id, kind)
+    db.execute(
+        text("DELETE FROM search_index WHERE rowid BETWEEN :lo AND :hi"),
+        {"lo": lo, "hi": hi},
+    )
+    rows = rows[: hi - lo + 1]
+    for offset, row in enumerate(rows):
+        row["rowid"] = lo + offset
+    if rows:
+        db.execute(
+            text(
+                "INSERT INTO search_index (rowid, text, owner, transcript_id, kind, start) "
+                "VALUES (:rowid, :text, :owner, :transcript_id, :kind, :start)"
+            ),
+            rows,
+        )
+
+
+def index_transcript(db: Session, record: Transcript) -> None:
+    """Index the stored segments of ``record``. The caller commits."""
+    if not enabled():
+        return
+    segments = (
+        db.query(Segment.text, Segment.start)
+        .filter(Segment.transcript_id == record.id)
+        .order_by(Segment.start)
+    )
+    rows = [(seg_text, start) for seg_text, start in segments]
+    if not rows and record.result:
+        # Transcripts from before segment storage only have formatted text.
+        for line in record.result.splitlines():
+            match = _LINE_START.match(line)
+            rows.append((line, float(match.group(1)) if match else None))
+    owner = _owner(record.user_id)
+    _replace(
+        db,
+        record.id,
+        "segment",
+        [
+            {"text": seg_text, "owner": owner, "transcript_id": record.id, "kind": "segment", "start": start}
+            for seg_text, start in rows
+        ],
+    )
+    record.search_indexed = 1
+
+
+def index_summary(db: Session, record: Transcript) -> None:
+    if not enabled():
+        return
+    rows = []
+    if record.summary and record.summary_status == "completed":
+        rows.append(
+            {
+                "text": record.summary,
+                "owner": _owner(record.user_id),
+                "transcript_id": record.id,
+                "kind": "summary",
+                "start": None,
+            }
+        )
+    _replace(db, record.id, "summary", rows)
+
+
+def _match_expression(query: str, user_id: int | None) -> str | None:
+    # Quote every term so user input cannot inject FTS5 query syntax.
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if not terms:
+        return None
+    # Anonymous queries only see anonymous uploads.
+    return f'owner : "{_owner(user_id)}" AND text : (' + " ".join(terms) + ")"
+
+
+def search(db: Session, query: str, user_id: int | None, limit: int = 50) -> list[dict]:
+    """Return ranked hits with an HTML snippet from ``user_id``'s transcripts (anonymous ones for ``None``)."""
+    expression = _match_expression(query, user_id)
+    if not expression or not enabled():
+        return []
+    rows = db.execute(
+        text(
+            "SELECT search_index.transcript_id, search_index.kind, search_index.start, "
+            "snippet(search_index, 0, :mark_start, :mark_end, '…', 16), t.filename "
+            "FROM search_index JOIN transcripts t ON t.id = search_index.transcript_id "
+            "WHERE search_index MATCH :expression ORDER BY search_index.rank LIMIT :limit"
+        ),
+        {"expression": expression, "mark_start": _MARK_START, "mark_end": _MARK_END, "limit": limit},
+    )
+    hits = []
+    for transcript_id, kind, start, snip, filename in rows:
+        snip = html.escape(snip).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+        hits.append(
+            {
+                "transcript_id": transcript_id,
+                "filename": filename,
+                "kind": kind,
+                "start": start,
+                "snippet": snip,
+            }
+        )
+    return hits
+
+
+def backfill() -> int:
+    """Index completed transcripts that predate the search index, in batches."""
+    if not enabled():
+        return 0
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            batch = (
+                db.query(Transcript)
+                .filter(Transcript.status == "completed", Transcript.search_indexed == 0)
+                .order_by(Transcript.id)
+                .limit(BACKFILL_BATCH)
+                .all()
+            )
+            if not batch:
+                break
+            for record in batch:
+                index_transcript(db, record)
+                index_summary(db, record)
+            db.commit()
+            total += len(batch)
+        finally:
+            db.close()
+    if total:
+        logger.info("Indexed %d transcripts for search", total)
+    return total
+
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+
+from sqlalchemy.orm import Session
+
+from .db import Segment
+
+STORE_WORDS = os.getenv("STORE_WORDS", "true").lower() in ("1", "true", "yes")
+# Longest segment range lookups account for, so they can scan the start index
+# from ``start - MAX_SEGMENT_SECONDS`` instead of from the beginning. Whisper
+# segments are at most 30 s; mapped back over skipped silence they can grow.
+MAX_SEGMENT_SECONDS = float(os.getenv("MAX_SEGMENT_SECONDS", "300"))
+
+_LINE = re.compile(r"^\[(\d+(?:\.\d+)?)s - (\d+(?:\.\d+)?)s\] (?:Speaker (.+?): )?(.*)$")
+
+
+def format_text(segments: list[dict]) -> str:
+    """Render segments as the plain timestamped text stored in ``Transcript.result``."""
+    lines = []
+    for seg in segments:
+        start = seg.get("start", 0)
+        end = seg.get("end", 0)
+        text = seg.get("text", "")
+        speaker = seg.get("speaker")
+        if speaker is not None:
+            lines.append(f"[{start:.2f}s - {end:.2f}s] Speaker {speaker}: {text}")
+        else:
+            lines.append(f"[{start:.2f}s - {end:.2f}s] {text}")
+    return "\n".join(lines)
+
+
+def parse_text(result: str) -> list[dict]:
+    """Inverse of ``format_text``, for transcripts stored before segments were."""
+    segments = []
+    for line in result.splitlines():
+        match = _LINE.match(line)
+        if match:
+            start, end, speaker, text = match.groups()
+            seg = {"start": float(start), "end": float(end), "text": text}
+            if speaker is not None:
+                seg["speaker"] = speaker
+            segments.append(seg)
+        elif segments and line.strip():
+            segments[-1]["text"] += "\n" + line
+    return segments
+
+
+def _pack_words(words: list[dict] | None) -> str | None:
+    # Words are stored as compact [start, end, word, speaker] rows.
+    if not STORE_WORDS or not words:
+        return None
+    return json.dumps(
+        [[w.get("start"), w.get("end"), w.get("word"), w.get("speaker")] for w in words],
+        separators=(",", ":"),
+    )
+
+
+def save_segments(db: Session, transcript_id: int, segments: list[dict]) -> None:
+    """Replace the stored segments of a transcript. The caller commits."""
+    db.query(Segment).filter(Segment.transcript_id == transcript_id).delete()
+    db.add_all(
+        Segment(
+            transcript_id=transcript_id,
+            position=i,
+            start=seg.get("start", 0),
+            end=seg.get("end", 0),
+            speaker=seg.get("speaker"),
+            text=seg.get("text", ""),
+            words=_pack_words(seg.get("words")),
+        )
+        for i, seg in enumerate(segments)
+    )
+
+
+def _shift(word: dict, offset: float) -> dict:
+    """``word`` with whichever of its times are known moved by ``offset``."""
+    return {
+        **word,
+        **{key: word[key] + offset for key in ("start", "end") if word.get(key) is not None},
+    }
+
+
+def append_segments(db: Session, transcript_id: int, segments: list[dict], offset: float = 0) -> None:
+    """Add segments shifted by ``offset`` seconds after those already stored. The caller commits."""
+    first = db.query(Segment).filter(Segment.transcript_id == transcript_id).count()
+    db.add_all(
+        Segment(
+            transcript_id=transcript_id,
+            position=first + i,
+            start=seg.get("start", 0) + offset,
+            end=seg.get("end", 0) + offset,
+            speaker=seg.get("speaker"),
+            text=seg.get("text", ""),
+            words=_pack_words([_shift(w, offset) for w in seg.get("words") or []]),
+        )
+        for i, seg in enumerate(segments)
+    )
+
+
+def copy_segments(db: Session, source_id: int, target_id: int) -> None:
+    save_segments(db, target_id, load_segments(db, source_id, with_words=True))
+
+
+def load_segments(
+    db: Session,
+    transcript_id: int,
+    start: float | None = None,
+    end: float | None = None,
+    with_words: bool = False,
+) -> list[dict]:
+    """Return segments overlapping ``[start, end)`` seconds, in time order."""
+    query = db.query(Segment).filter(Segment.transcript_id == transcript_id)
+    if end is not None:
+        query = query.filter(Segment.start < end)
+    if start is not None:
+        # The lower bound on start keeps this a range scan of the index.
+        query = query.filter(Segment.start >= start - MAX_SEGMENT_SECONDS, Segment.end > start)
+    segments = []
+    for row in query.order_by(Segment.start, Segment.position):
+        seg = {"start": row.start, "end": row.end, "text": row.text}
+        if row.speaker is not None:
+            seg["speaker"] = row.speaker
+        if with_words and row.words:
+            seg["words"] = [
+                {"start": s, "end": e, "word": w, **({"speaker": sp} if sp is not None else {})}
+                for s, e, w, sp in json.loads(row.words)
+            ]
+        segments.append(seg)
+    return segments
+
+
+def _timestamp(seconds: float, sep: str) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{sep}{millis:03d}"
+
+
+def _cue_text(seg: dict) -> str:
+    text = seg.get("text", "").strip()
+    speaker = seg.get("speaker")
+    return f"[{speaker}] {text}" if speaker is not None else text
+
+
+def to_srt(segments: list[dict]) -> str:
+    cues = []
+    for i, seg in enumerate(segments, 1):
+        cues.append(
+            f"{i}\n{_timestamp(seg['start'], ',')} --> {_timestamp(seg['end'], ',')}\n{_cue_text(seg)}\n"
+        )
+    return "\n".join(cues)
+
+
+def to_vtt(segments: list[dict]) -> str:
+    cues = ["WEBVTT\n"]
+    for seg in segments:
+        speaker = seg.get("speaker")
+        text = seg.get("text", "").strip()
+        if speaker is not None:
+            text = f"<v {speaker}>{text}"
+        cues.append(f"{_timestamp(seg['start'], '.')} --> {_timestamp(seg['end'], '.')}\n{text}\n")
+    return "\n".join(cues)
+
+
+def to_json(segments: list[dict]) -> str:
+    return json.dumps({"segments": segments}, ensure_ascii=False)
+
+
+EXPORTERS = {
+    "srt": (to_srt, "application/x-subrip"),
+    "vtt": (to_vtt, "text/vtt"),
+    "json": (to_json, "application/json"),
+}
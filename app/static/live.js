@@ -0,0 +1,46 @@
+document.addEventListener('DOMContentLoaded', () => {
+  const live = document.querySelectorAll('[data-live-summary]');
+  const statuses = document.querySelectorAll('[data-live-status]');
+  if (!window.EventSource || (!live.length && !statuses.length)) return;
+
+  const summaries = {};
+  // Tokens that arrive before the saved text has loaded; appended to it once it does.
+  const pending = {};
+  live.forEach(el => {
+    const id = el.getAttribute('data-live-summary');
+    summaries[id] = el;
+    pending[id] = '';
+    // Start from what has been saved so far, then append streamed tokens.
+    fetch(`/text/${id}?kind=summary`)
+      .then(r => r.ok ? r.text() : '')
+      .catch(() => '')
+      .then(text => {
+        el.textContent = text + pending[id];
+        pending[id] = null;
+      });
+  });
+  const statusCells = {};
+  statuses.forEach(el => { statusCells[el.getAttribute('data-live-status')] = el; });
+
+  const source = new EventSource('/events');
+  source.onmessage = e => {
+    const data = JSON.parse(e.data);
+    const summary = summaries[data.id];
+    if (summary && data.summary_delta) {
+      if (pending[data.id] === null) summary.textContent += data.summary_delta;
+      else pending[data.id] += data.summary_delta;
+    }
+    const cell = statusCells[data.id];
+    if (cell && data.status) {
+      cell.textContent = data.status === 'processing' && data.stage
+        ? `${data.status} (${data.stage} ${data.progress || 0}%)`
+        : data.status;
+    }
+    const finished = (summary && data.summary_status && data.summary_status !== 'processing')
+      || (cell && ['completed', 'failed', 'cancelled'].includes(data.status));
+    if (finished) {
+      source.close();
+      window.location.reload();
+    }
+  };
+});
@@ -0,0 +1,93 @@
+document.addEventListener('DOMContentLoaded', () => {
+  const CHUNK_MS = 5000;
+  const startBtn = document.getElementById('record-start');
+  const stopBtn = document.getElementById('record-stop');
+  const status = document.getElementById('record-status');
+  const text = document.getElementById('record-text');
+  if (!navigator.mediaDevices || !window.MediaRecorder) {
+    status.textContent = 'Recording is not supported in this browser.';
+    startBtn.disabled = true;
+    return;
+  }
+
+  let stream = null;
+  let session = null;
+  let transcriptId = null;
+  let seq = 0;
+  let startedAt = 0;
+  let recording = false;
+  let uploads = Promise.resolve();
+  let source = null;
+
+  const refresh = () => {
+    if (!transcriptId) return;
+    fetch(`/text/${transcriptId}`).then(r => r.ok ? r.text() : '').then(t => { if (t) text.textContent = t; });
+  };
+
+  const send = (blob, n, offset) => {
+    const form = new FormData();
+    form.append('file', blob, `chunk-${n}.webm`);
+    form.append('seq', n);
+    form.append('start', offset);
+    // Chunks are sent one after another so the first one can create the session.
+    uploads = uploads.then(() => {
+      if (session !== null) form.append('session', session);
+      return fetch('/api/record', { method: 'POST', body: form })
+        .then(r => r.json())
+        .then(data => {
+          if (session === null) {
+            session = data.session;
+            transcriptId = data.transcript_id;
+            source = new EventSource('/events');
+            source.onmessage = e => {
+              const event = JSON.parse(e.data);
+              if (event.id !== transcriptId) return;
+              refresh();
+              if (event.status === 'completed' || event.status === 'failed') {
+                status.textContent = event.status;
+                source.close();
+              }
+            };
+          }
+        });
+    }).catch(() => { status.textContent = 'Upload failed'; });
+  };
+
+  // Each chunk comes from its own MediaRecorder so that it is a complete,
+  // independently decodable file.
+  const recordChunk = () => {
+    if (!recording) return;
+    const n = seq++;
+    const offset = (performance.now() - startedAt) / 1000;
+    const recorder = new MediaRecorder(stream);
+    const parts = [];
+    recorder.ondataavailable = e => { if (e.data.size) parts.push(e.data); };
+    recorder.onstop = () => {
+      if (parts.length) send(new Blob(parts, { type: recorder.mimeType }), n, offset);
+      if (recording) {
+        recordChunk();
+      } else {
+        uploads.then(() => session !== null && fetch(`/api/record/${session}/stop`, { method: 'POST' }));
+        stream.getTracks().forEach(t => t.stop());
+      }
+    };
+    recorder.start();
+    setTimeout(() => recorder.state === 'recording' && recorder.stop(), CHUNK_MS);
+    stopBtn.onclick = () => {
+      recording = false;
+      stopBtn.disabled = true;
+      status.textContent = 'Finishing…';
+      if (recorder.state === 'recording') recorder.stop();
+    };
+  };
+
+  startBtn.onclick = async () => {
+    stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+    recording = true;
+    startedAt = performance.now();
+    startBtn.disabled = true;
+    stopBtn.disabled = false;
+    status.textContent = 'Recording…';
+    recordChunk();
+  };
+});
@@ -7,9 +7,14 @@ document.addEventListener('DOMContentLoaded', () => {
   modal.addEventListener('show.bs.modal', event => {
     const trigger = event.relatedTarget;
     if (!trigger) return;
-    const text = trigger.getAttribute('data-content') || '';
+    const url = trigger.getAttribute('data-url');
     const dl = trigger.getAttribute('data-download') || '#';
-    pre.textContent = text;
     download.href = dl;
+    pre.textContent = 'Loading...';
+    modal.dataset.url = url;
+    fetch(url).then(r => r.ok ? r.text() : '').then(text => {
+      // Ignore responses for a trigger that is no longer shown.
+      if (modal.dataset.url === url) pre.textContent = text;
+    });
   });
 });
@@ -0,0 +1,95 @@
+// Large files are sent as a resumable chunked upload: chunks go up in
+// parallel with a SHA-256 each, and submitting the same file again after a
+// dropped connection only sends the chunks the server is missing.
+document.addEventListener('DOMContentLoaded', () => {
+  const PARALLEL = 4;
+  const RETRIES = 5;
+  const form = document.getElementById('upload-form');
+  const progress = document.getElementById('upload-progress');
+  if (!form || !window.fetch) return;
+
+  const sha256 = async blob => {
+    // SubtleCrypto needs a secure context; without it the server's own hash is used.
+    if (!window.crypto || !crypto.subtle) return null;
+    const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+  };
+
+  const key = file => `upload:${file.name}:${file.size}:${file.lastModified}`;
+
+  const start = async file => {
+    const saved = localStorage.getItem(key(file));
+    if (saved) {
+      const r = await fetch(`/api/uploads/${saved}`);
+      if (r.ok) {
+        const state = await r.json();
+        if (state.status === 'uploading') return state;
+      }
+    }
+    const body = new FormData();
+    body.append('filename', file.name);
+    body.append('size', file.size);
+    if (form.elements.priority.checked) body.append('priority', 'bulk');
+    const r = await fetch('/api/uploads', { method: 'POST', body });
+    if (!r.ok) throw new Error(`Upload refused (${r.status})`);
+    const state = await r.json();
+    localStorage.setItem(key(file), state.upload_id);
+    return state;
+  };
+
+  const sendChunk = async (file, state, seq) => {
+    const blob = file.slice(seq * state.chunk_size, (seq + 1) * state.chunk_size);
+    const headers = {};
+    const digest = await sha256(blob);
+    if (digest) headers['X-Chunk-SHA256'] = digest;
+    for (let attempt = 1; ; attempt++) {
+      let r = null;
+      try {
+        r = await fetch(`/api/uploads/${state.upload_id}/chunks/${seq}`, { method: 'PUT', headers, body: blob });
+      } catch (err) {
+        // Network error: retried below.
+      }
+      if (r && r.ok) return;
+      // 422 means the chunk arrived damaged; other client errors will not go away.
+      if (r && r.status !== 422 && r.status < 500) throw new Error(`Chunk ${seq} refused (${r.status})`);
+      if (attempt >= RETRIES) throw new Error(`Chunk ${seq} failed`);
+      await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+    }
+  };
+
+  const upload = async file => {
+    const state = await start(file);
+    const have = new Set(state.received);
+    const todo = [];
+    for (let seq = 0; seq < state.chunks; seq++) if (!have.has(seq)) todo.push(seq);
+    let done = state.chunks - todo.length;
+    const show = () => { progress.textContent = `Uploading ${Math.floor(done * 100 / state.chunks)}%`; };
+    show();
+    // Lower chunks first, so the server can start decoding the beginning of the file.
+    const worker = async () => {
+      while (todo.length) {
+        await sendChunk(file, state, todo.shift());
+        done++;
+        show();
+      }
+    };
+    await Promise.all(Array.from({ length: PARALLEL }, worker));
+    const r = await fetch(`/api/uploads/${state.upload_id}/complete`, { method: 'POST' });
+    if (!r.ok) throw new Error(`Upload could not be completed (${r.status})`);
+    localStorage.removeItem(key(file));
+  };
+
+  form.addEventListener('submit', event => {
+    const file = form.elements.file.files[0];
+    // Small files go through the plain form post.
+    if (!file || file.size <= 8 * 1024 * 1024) return;
+    event.preventDefault();
+    form.querySelector('button[type=submit]').disabled = true;
+    upload(file)
+      .then(() => { window.location = '/'; })
+      .catch(err => {
+        progress.textContent = `${err.message}. Submit the same file again to resume.`;
+        form.querySelector('button[type=submit]').disabled = false;
+      });
+  });
+});
@@ -0,0 +1,109 @@
+import os
+import hashlib
+import tempfile
+import subprocess
+from typing import BinaryIO
+
+from sqlalchemy.orm import Session
+
+from .db import Transcript
+
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "data")
+OBJECTS_DIR = os.path.join(UPLOAD_DIR, "objects")
+_COPY_BYTES = 1024 * 1024
+
+
+def object_path(content_hash: str) -> str:
+    """Return where media with the given SHA-256 hex digest is stored."""
+    return os.path.join(OBJECTS_DIR, content_hash[:2], content_hash)
+
+
+def store_upload(fileobj: BinaryIO) -> tuple[str, str]:
+    """Stream ``fileobj`` into the content-addressed store.
+
+    The SHA-256 is computed while the data is written to a temporary file,
+    which is then moved into place. If identical media is already stored the
+    temporary copy is discarded. Returns ``(content_hash, path)``.
+    """
+    os.makedirs(OBJECTS_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(prefix="upload_", dir=OBJECTS_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = fileobj.read(_COPY_BYTES)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+        content_hash = digest.hexdigest()
+        return content_hash, store_file(temp_path, content_hash)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def store_file(temp_path: str, content_hash: str) -> str:
+    """Move a complete file with the given digest into the store and return its path.
+
+    If identical media is already stored, ``temp_path`` is discarded instead.
+    """
+    path = object_path(content_hash)
+    if os.path.exists(path):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    return path
+
+
+def media_file(content_hash: str | None, media_path: str | None = None) -> str | None:
+    """Return where a transcript's media can still be read, or ``None`` if it is gone."""
+    for path in (object_path(content_hash) if content_hash else None, media_path):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 hex digest of the file at ``path``, as ``store_upload`` computes it."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while True:
+            block = fh.read(_COPY_BYTES)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def probe_duration(path: str) -> float | None:
+    """Return the media duration in seconds according to ffprobe, if known."""
+    try:
+        out = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                path,
+            ],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        return float(out)
+    except (subprocess.CalledProcessError, ValueError, FileNotFoundError):
+        return None
+
+
+def find_transcript(db: Session, content_hash: str, pipeline: str) -> Transcript | None:
+    """Return a completed transcript of the same media made with the same pipeline."""
+    return (
+        db.query(Transcript)
+        .filter(
+            Transcript.content_hash == content_hash,
+            Transcript.pipeline == pipeline,
+            Transcript.status == "completed",
+        )
+        .order_by(Transcript.id.desc())
+        .first()
+    )
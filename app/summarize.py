@@ -1,7 +1,113 @@
 import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Protocol
+
 import requests
+from requests.adapters import HTTPAdapter
 import openai
 
+logger = logging.getLogger(__name__)
+
+# Transcripts estimated above this many tokens are summarized map-reduce style.
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+_SPEAKER = re.compile(r"\] Speaker (\S+):")
+TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "60"))
+
+# Keep-alive clients reused across summaries: one OpenAI client per API key
+# and one pooled HTTP session for Ollama.
+_openai_clients: dict[str, openai.OpenAI] = {}
+_http_session: requests.Session | None = None
+_clients_lock = threading.Lock()
+
+
+def _openai_client(api_key: str) -> openai.OpenAI:
+    with _clients_lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            client = openai.OpenAI(api_key=api_key, timeout=TIMEOUT)
+            _openai_clients[api_key] = client
+        return client
+
+
+def _session() -> requests.Session:
+    global _http_session
+    with _clients_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(CONCURRENCY, 10))
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+        return _http_session
+
+
+class Checkpoint(Protocol):
+    def get(self, key: str) -> str | None: ...
+
+    def put(self, key: str, value: str) -> None: ...
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; good enough for budgeting.
+    return len(text) // 4 + 1
+
+
+def split_transcript(text: str, max_tokens: int | None = None) -> list[str]:
+    """Split a transcript into chunks of at most ``max_tokens`` on segment lines.
+
+    Once a chunk is three quarters full it is closed at the next change of
+    speaker, so that a speaker's turn is rarely split across chunks.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    chunks: list[str] = []
+    current: list[str] = []
+    used = 0
+    last_speaker = None
+    for line in text.splitlines():
+        cost = estimate_tokens(line)
+        match = _SPEAKER.search(line)
+        speaker = match.group(1) if match else None
+        speaker_changed = speaker is not None and speaker != last_speaker
+        if current and (
+            used + cost > max_tokens or (used > max_tokens * 3 // 4 and speaker_changed)
+        ):
+            chunks.append("\n".join(current))
+            current, used = [], 0
+        current.append(line)
+        used += cost
+        last_speaker = speaker
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _map_prompt(text: str, mode: str, index: int, total: int) -> str:
+    return (
+        f"The following is part {index} of {total} of an audio transcript. "
+        f"Summarize this part so it can later be combined with the others ({mode}). "
+        f"Keep names, decisions, figures and action items.\n\n{text}"
+    )
+
+
+def _reduce_prompt(text: str, mode: str) -> str:
+    return (
+        "The following are summaries of consecutive parts of one audio transcript. "
+        f"Combine them into a single clear and concise summary ({mode}):\n\n{text}"
+    )
+
+
+def engine_and_model(ollama_model: str | None = None) -> tuple[str, str]:
+    """Return the configured summarization engine and the model it will use."""
+    engine = os.getenv("SUMMARIZATION_ENGINE", "openai")
+    if engine == "openai":
+        return engine, os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    return engine, ollama_model or os.getenv("OLLAMA_MODEL", "mistral")
+
 
 def summarize(
     text: str,
@@ -9,19 +115,104 @@ def summarize(
     openai_api_key: str | None = None,
     ollama_url: str | None = None,
     ollama_model: str | None = None,
+    checkpoint: Checkpoint | None = None,
+    on_delta: Callable[[str], None] | None = None,
 ) -> str:
-    engine = os.getenv("SUMMARIZATION_ENGINE", "openai")
-    if engine == "openai":
-        return summarize_openai(text, mode, openai_api_key)
-    return summarize_ollama(text, mode, url=ollama_url, model=ollama_model)
+    """Summarize ``text``; ``on_delta`` receives the final summary as it streams in."""
+    engine, model = engine_and_model(ollama_model)
+
+    def complete(prompt: str | None, on_delta: Callable[[str], None] | None = None) -> str:
+        if engine == "openai":
+            return summarize_openai(text, mode, openai_api_key, prompt=prompt, on_delta=on_delta)
+        return summarize_ollama(
+            text, mode, url=ollama_url, model=ollama_model, prompt=prompt, on_delta=on_delta
+        )
+
+    if estimate_tokens(text) <= CHUNK_TOKENS:
+        return complete(None, on_delta)
+    return _map_reduce(text, mode, complete, f"{engine}/{model}", checkpoint, on_delta)
 
 
-def summarize_openai(text: str, mode: str, api_key: str | None = None) -> str:
+def _group(partials: list[str], max_tokens: int) -> list[list[str]]:
+    """Pack whole partial summaries into groups that fit ``max_tokens``.
+
+    Every group holds at least two partials so each merge level shrinks the list.
+    """
+    groups: list[list[str]] = []
+    used = 0
+    for partial in partials:
+        cost = estimate_tokens(partial)
+        if groups and (len(groups[-1]) < 2 or used + cost <= max_tokens):
+            groups[-1].append(partial)
+            used += cost
+        else:
+            groups.append([partial])
+            used = cost
+    return groups
+
+
+def _map_reduce(
+    text: str,
+    mode: str,
+    complete: Callable[..., str],
+    engine_key: str,
+    checkpoint: Checkpoint | None,
+    on_delta: Callable[[str], None] | None = None,
+) -> str:
+    """Summarize chunks concurrently, then merge the partial summaries level by level.
+
+    Only the last merge, which produces the final summary, is streamed to ``on_delta``.
+    """
+
+    def run(prompt: str, on_delta: Callable[[str], None] | None = None) -> str:
+        # Checkpoints are keyed by the exact prompt, so a retried job reuses
+        # every chunk and merge that already finished.
+        key = hashlib.sha256(f"{engine_key}\n{prompt}".encode()).hexdigest()
+        if checkpoint is not None:
+            cached = checkpoint.get(key)
+            if cached is not None:
+                if on_delta:
+                    on_delta(cached)
+                return cached
+        result = complete(prompt, on_delta)
+        if checkpoint is not None:
+            checkpoint.put(key, result)
+        return result
+
+    chunks = split_transcript(text)
+    logger.info("Summarizing %d chunks with concurrency %d", len(chunks), CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        partials = list(
+            pool.map(run, [_map_prompt(c, mode, i, len(chunks)) for i, c in enumerate(chunks, 1)])
+        )
+        while len(partials) > 1:
+            groups = _group(partials, CHUNK_TOKENS)
+            if len(groups) == 1:
+                return run(_reduce_prompt("\n\n".join(groups[0]), mode), on_delta)
+            partials = list(
+                pool.map(
+                    lambda g: g[0] if len(g) == 1 else run(_reduce_prompt("\n\n".join(g), mode)),
+                    groups,
+                )
+            )
+    if on_delta:
+        on_delta(partials[0])
+    return partials[0]
+
+
+def summarize_openai(
+    text: str,
+    mode: str,
+    api_key: str | None = None,
+    *,
+    prompt: str | None = None,
+    on_delta: Callable[[str], None] | None = None,
+) -> str:
     api_key = api_key or os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY not configured")
-    client = openai.OpenAI(api_key=api_key)
-    prompt = f"Summarize the following audio transcript in a clear and concise format ({mode}):\n\n{text}"
+    client = _openai_client(api_key)
+    prompt = prompt or f"Summarize the following audio transcript in a clear and concise format ({mode}):\n\n{text}"
     response = client.chat.completions.create(
         model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
         messages=[
@@ -29,8 +220,17 @@ def summarize_openai(text: str, mode: str, api_key: str | None = None) -> str:
             {"role": "user", "content": prompt},
         ],
         temperature=0.3,
+        stream=on_delta is not None,
     )
-    return response.choices[0].message.content
+    if on_delta is None:
+        return response.choices[0].message.content
+    parts = []
+    for chunk in response:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            on_delta(delta)
+    return "".join(parts)
 
 
 def summarize_ollama(
@@ -39,14 +239,38 @@ def summarize_ollama(
     *,
     url: str | None = None,
     model: str | None = None,
+    prompt: str | None = None,
+    on_delta: Callable[[str], None] | None = None,
 ) -> str:
     payload = {
         "model": model or os.getenv("OLLAMA_MODEL", "mistral"),
-        "prompt": f"Summarize the following transcript ({mode}):\n\n{text}",
-        "stream": False,
+        "prompt": prompt or f"Summarize the following transcript ({mode}):\n\n{text}",
+        "stream": on_delta is not None,
     }
     url = url or os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
-    response = requests.post(url, json=payload, timeout=60)
+    if on_delta is not None:
+        return _stream_ollama(url, payload, on_delta)
+    response = _session().post(url, json=payload, timeout=TIMEOUT)
     response.raise_for_status()
     data = response.json()
     return data.get("response", "")
+
+
+def _stream_ollama(url: str, payload: dict, on_delta: Callable[[str], None]) -> str:
+    # With streaming the timeout applies between tokens, not to the whole reply.
+    parts = []
+    with _session().post(url, json=payload, timeout=TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(data["error"])
+            delta = data.get("response", "")
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+            if data.get("done"):
+                break
+    return "".join(parts)
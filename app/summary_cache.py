@@ -0,0 +1,99 @@
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import func
+
+from .db import SessionLocal, SummaryCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_MB = int(os.getenv("SUMMARY_CACHE_MB", "256"))
+
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def cache_key(text: str, mode: str, engine: str, model: str) -> str:
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return f"{digest}:{mode}:{engine}:{model}"
+
+
+def get(key: str) -> str | None:
+    db = SessionLocal()
+    try:
+        row = db.query(SummaryCache).filter_by(key=key).first()
+        if row is None:
+            return None
+        row.last_used_at = datetime.utcnow()
+        db.commit()
+        return row.summary
+    finally:
+        db.close()
+
+
+def put(key: str, summary: str) -> None:
+    db = SessionLocal()
+    try:
+        row = db.query(SummaryCache).filter_by(key=key).first()
+        if row is None:
+            row = SummaryCache(key=key)
+            db.add(row)
+        row.summary = summary
+        row.size = len(summary.encode())
+        row.last_used_at = datetime.utcnow()
+        db.commit()
+        _evict(db)
+    finally:
+        db.close()
+
+
+def _evict(db) -> None:
+    """Drop least recently used entries until the cache fits ``SUMMARY_CACHE_MB``."""
+    limit = CACHE_MB * 1024 * 1024
+    total = db.query(func.coalesce(func.sum(SummaryCache.size), 0)).scalar()
+    if total <= limit:
+        return
+    doomed = []
+    for row_id, size in db.query(SummaryCache.id, SummaryCache.size).order_by(SummaryCache.last_used_at):
+        if total <= limit:
+            break
+        total -= size or 0
+        doomed.append(row_id)
+    db.query(SummaryCache).filter(SummaryCache.id.in_(doomed)).delete(synchronize_session=False)
+    db.commit()
+    logger.info("Evicted %d cached summaries", len(doomed))
+
+
+def get_or_compute(key: str, compute: Callable[[], str]) -> str:
+    """Return the cached summary for ``key`` or compute it once.
+
+    Concurrent callers with the same key share a single computation, so a
+    double-submitted summary request results in one LLM call.
+    """
+    cached = get(key)
+    if cached is not None:
+        return cached
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+    if not owner:
+        return future.result()
+    try:
+        summary = compute()
+        put(key, summary)
+        future.set_result(summary)
+        return summary
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
@@ -1,95 +1,522 @@
 import os
+import json
+import time
+import hashlib
 import logging
 import tempfile
 import shutil
+from contextlib import nullcontext
 
-from pydub import AudioSegment
+import numpy as np
+import pandas as pd
 import whisperx
 
-from .db import Transcript, SessionLocal, User
-from .summarize import summarize
+from .artifacts import AUDIO_KEY, ArtifactStore, stage_key, ENABLED as ARTIFACTS_ENABLED
+from .audio import decode_audio, SAMPLE_RATE
+from .chunking import (
+    transcribe_long,
+    transcribe_pieces,
+    LONG_AUDIO_SECONDS,
+    WINDOW_SECONDS,
+    OVERLAP_SECONDS,
+    PIECE_SECONDS,
+)
+from .db import (
+    Transcript,
+    TranscriptChunk,
+    SummaryChunk,
+    RecordingChunk,
+    SessionLocal,
+    Upload,
+    User,
+)
+from .events import publish_progress
+from .graph import StageGraph
+from .jobs import (
+    TRANSCRIBE_QUEUE,
+    LIVE_QUEUE,
+    DECODE_QUEUE,
+    JobCancelled,
+    current_job,
+    discard_queued,
+    has_active_job,
+    queue_wait,
+    raise_if_cancelled,
+)
+from .metrics import JobMetrics
+from .models import get_asr_model, get_align_model, get_diarize_model
+from .pipeline import (
+    STAGE_PROGRESS,
+    hf_token_for,
+    pipeline_signature,
+    set_stage,
+    finish_recording_if_done,
+)
+from .runtime import PROFILE
+from .search import index_transcript, index_summary
+from .segments import format_text, save_segments, copy_segments, append_segments, load_segments
+from .storage import find_transcript
+from .uploads import follow as follow_upload, store as store_upload
+from . import vad
+from .vad import pack_speech
+from .summarize import summarize, engine_and_model
+from . import summary_cache
 
 logger = logging.getLogger(__name__)
 
-def _convert_to_wav(path: str, temp_dir: str) -> str:
-    """Convert input audio to wav if necessary and return new path."""
-    if path.lower().endswith(".wav"):
-        return path
-    wav_path = os.path.join(temp_dir, "audio.wav")
-    audio = AudioSegment.from_file(path)
-    audio.export(wav_path, format="wav")
-    return wav_path
+SUMMARY_STREAM = os.getenv("SUMMARY_STREAM", "true").lower() in ("1", "true", "yes")
+SUMMARY_FLUSH_SECONDS = float(os.getenv("SUMMARY_FLUSH_SECONDS", "1"))
+# Segments aligned per call, between which cancellation is checked.
+ALIGN_GROUP = 50
 
 
-def _run_whisperx(wav_path: str, hf_token: str | None = None) -> str:
-    """Run WhisperX with optional diarization and return timestamped text."""
+def _run_whisperx(
+    audio: np.ndarray,
+    hf_token: str | None = None,
+    done_chunks: dict[int, dict] | None = None,
+    on_chunk=None,
+    on_stage=None,
+    metrics: JobMetrics | None = None,
+    artifacts: ArtifactStore | None = None,
+    check=None,
+) -> list[dict]:
+    """Run WhisperX with optional diarization on decoded 16 kHz audio and return aligned segments.
 
-    # Load ASR model
-    model = whisperx.load_model("base", device="cpu", compute_type="float32")
+    Long silences are removed first, so every model sees only the speech;
+    timestamps are mapped back to ``audio`` before returning. Stage outputs
+    found in ``artifacts`` are reused instead of being computed again.
+    ``check`` is called between pieces of work inside each stage and may
+    raise to stop the run, e.g. when the job is cancelled.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    span = metrics.span if metrics else (lambda stage: nullcontext())
+    artifacts = artifacts or ArtifactStore(None)
 
-    # Transcribe audio
-    result = model.transcribe(wav_path, batch_size=16)
+    with span("vad"):
+        audio, timeline = pack_speech(audio)
+    if not len(audio):
+        return []
 
-    # Align words to improve timestamps
-    model_a, metadata = whisperx.load_align_model(language_code="en", device="cpu")
-    result = whisperx.align(result["segments"], model_a, metadata, wav_path, device="cpu")
+    is_long = len(audio) > LONG_AUDIO_SECONDS * SAMPLE_RATE
+    asr_key = stage_key(
+        stage="asr",
+        audio=AUDIO_KEY,
+        vad=vad.SETTINGS,
+        model=PROFILE.model_size,
+        compute_type=PROFILE.compute_type,
+        windows=[WINDOW_SECONDS, OVERLAP_SECONDS] if is_long else [PIECE_SECONDS],
+    )
+    align_key = stage_key(stage="align", asr=asr_key)
+    diarize_key = stage_key(stage="diarize", audio=AUDIO_KEY, vad=vad.SETTINGS)
 
-    # Perform speaker diarization if token provided
-    if hf_token:
+    def stop_if_needed() -> None:
+        graph.check()
+        if check:
+            check()
+
+    def transcribe() -> dict:
+        stop_if_needed()
+        on_stage("asr")
+        result = artifacts.load("asr", asr_key)
+        if result is None:
+            result = run_asr()
+            artifacts.save("asr", asr_key, result)
+        return result
+
+    def run_asr() -> dict:
+        # Long recordings are split across a process pool
+        if is_long:
+            with span("asr"):
+                return transcribe_long(
+                    audio,
+                    PROFILE.model_size,
+                    PROFILE.compute_type,
+                    batch_size=PROFILE.batch_size,
+                    done=done_chunks,
+                    on_chunk=on_chunk,
+                    check=stop_if_needed,
+                )
+        with span("model_load"):
+            model = get_asr_model(PROFILE.model_size, PROFILE.compute_type, threads=PROFILE.threads)
+        with span("asr"):
+            return transcribe_pieces(model, audio, PROFILE.batch_size, check=stop_if_needed)
+
+    def align(result: dict) -> dict:
+        # Align words to improve timestamps
+        stop_if_needed()
+        on_stage("align")
+        aligned = artifacts.load("align", align_key)
+        if aligned is None:
+            aligned = run_align(result)
+            artifacts.save("align", align_key, aligned)
+        return aligned
+
+    def run_align(result: dict) -> dict:
+        with span("model_load"):
+            model_a, metadata = get_align_model(result.get("language") or "en")
+        aligned = {"segments": [], "word_segments": []}
+        with span("align"):
+            # Segments are aligned independently, so groups give the same result.
+            segments = result["segments"]
+            for pos in range(0, len(segments), ALIGN_GROUP):
+                stop_if_needed()
+                part = whisperx.align(segments[pos:pos + ALIGN_GROUP], model_a, metadata, audio, device="cpu")
+                aligned["segments"].extend(part.get("segments", []))
+                aligned["word_segments"].extend(part.get("word_segments", []))
+        return aligned
+
+    def diarize():
+        stop_if_needed()
+        records = artifacts.load("diarize", diarize_key)
+        if records is not None:
+            return pd.DataFrame(records, columns=["start", "end", "speaker"])
+        turns = run_diarize()
+        if turns is not None:
+            records = turns[["start", "end", "speaker"]].to_dict("records")
+            artifacts.save("diarize", diarize_key, records)
+        return turns
+
+    def run_diarize():
         try:
-            diarize_model = whisperx.diarize.DiarizationPipeline(use_auth_token=hf_token, device="cpu")
-            diarize_segments = diarize_model(wav_path)
-            result = whisperx.assign_word_speakers(diarize_segments, result)
+            with span("model_load"):
+                diarize_model = get_diarize_model(hf_token)
+            # Loading can take minutes; skip the run if ASR failed meanwhile.
+            stop_if_needed()
+            with span("diarize"):
+                return diarize_model(audio)
         except AttributeError:
             # Older versions of whisperx do not have diarization
             logger.warning("DiarizationPipeline not available; skipping diarization")
+            return None
+
+    def assign_speakers(result: dict, turns) -> dict:
+        on_stage("diarize")
+        return whisperx.assign_word_speakers(turns, result) if turns is not None else result
+
+    # Diarization needs only the audio, so it runs alongside ASR and alignment
+    # and is merged in at speaker assignment. Progress is reported from the
+    # ASR/align chain only, which keeps the job's session on one thread at a time.
+    graph = StageGraph()
+    graph.add("asr", transcribe)
+    graph.add("align", align, "asr")
+    if hf_token:
+        # Diarization only reads the audio, so a failed run need not wait for it.
+        graph.add("diarize", diarize, background=True)
+        graph.add("assign", assign_speakers, "align", "diarize")
+    results = graph.run()
+    result = results["assign"] if hf_token else results["align"]
 
     segments = result.get("segments", [])
-    lines = []
-    for seg in segments:
-        start = seg.get("start", 0)
-        end = seg.get("end", 0)
-        text = seg.get("text", "")
-        speaker = seg.get("speaker")
-        if speaker is not None:
-            lines.append(f"[{start:.2f}s - {end:.2f}s] Speaker {speaker}: {text}")
-        else:
-            lines.append(f"[{start:.2f}s - {end:.2f}s] {text}")
+    return timeline.map_segments(segments) if timeline else segments
 
-    return "\n".join(lines)
 
+def decode_upload(record_id: int, upload_id: int) -> None:
+    """Decode an upload while it arrives and keep the audio for its transcription.
 
-def transcribe_file(record_id: int, file_path: str) -> None:
+    Runs on the decode queue, so waiting for chunks never holds a
+    transcription worker. The file is hashed as it is read, so storing it
+    afterwards is only a rename. Failures are logged and otherwise ignored:
+    the transcription job then decodes the file itself.
+    """
+    if not ARTIFACTS_ENABLED:
+        # There would be nowhere to hand the audio over.
+        return
+    db = SessionLocal()
+    temp_dir = tempfile.mkdtemp(prefix="decode_")
+    digest = hashlib.sha256()
+    read = 0
+
+    def source():
+        nonlocal read
+        for block in follow_upload(upload_id):
+            digest.update(block)
+            read += len(block)
+            yield block
+
+    try:
+        upload = db.get(Upload, upload_id)
+        if not upload or upload.status != "uploading":
+            # Already complete: the transcription job decodes it in one go.
+            return
+        size, path = upload.size, upload.path
+        db.rollback()
+        audio = decode_audio(path, temp_dir, source())
+        if read != size:
+            logger.warning("Decoder stopped at byte %d of upload %s", read, upload_id)
+            return
+        upload = db.get(Upload, upload_id)
+        store_upload(db, upload, digest.hexdigest())
+        ArtifactStore(db.get(Transcript, record_id).content_hash).save_audio(AUDIO_KEY, audio)
+    except JobCancelled:
+        logger.info("Decoding of upload %s cancelled", upload_id)
+    except Exception:
+        logger.exception("Decoding upload %s while it arrived failed", upload_id)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        db.close()
+
+
+def _stored_upload(db, record_id: int, upload_id: int) -> str | None:
+    """Store a complete upload once its decode job is done and return the media path."""
+    # A decode job that has not started would only repeat the work; a running
+    # one has at most the tail of the file left and leaves its audio behind.
+    discard_queued(DECODE_QUEUE, record_id)
+    while has_active_job(DECODE_QUEUE, record_id):
+        raise_if_cancelled(record_id)
+        time.sleep(1)
+    db.expire_all()
+    upload = db.get(Upload, upload_id)
+    if not upload or upload.status not in ("complete", "stored"):
+        return None
+    return store_upload(db, upload)
+
+
+def _mark_completed(db, record: Transcript, result: str) -> None:
+    """Complete ``record`` unless it was cancelled since the last check."""
+    updated = (
+        db.query(Transcript)
+        .filter(Transcript.id == record.id, Transcript.status != "cancelled")
+        .update({"status": "completed", "result": result})
+    )
+    if not updated:
+        raise JobCancelled(f"Transcript {record.id} was cancelled")
+
+
+def transcribe_file(record_id: int, file_path: str, upload_id: int | None = None) -> None:
     db = SessionLocal()
     record = db.get(Transcript, record_id)
     if not record:
         db.close()
         return
-
-    record.status = "processing"
-    db.commit()
-
+    metrics = JobMetrics(TRANSCRIBE_QUEUE)
+    job = current_job()
+    wait = queue_wait(job) if job else None
+    audio_seconds = None
     temp_dir = tempfile.mkdtemp(prefix="transcribe_")
     try:
-        wav_path = _convert_to_wav(file_path, temp_dir)
+        if upload_id is not None:
+            file_path = _stored_upload(db, record_id, upload_id)
+            if file_path is None:
+                logger.warning("Upload %s of transcript %s is not complete", upload_id, record_id)
+                return
+            record = db.get(Transcript, record_id)
+
         user = db.get(User, record.user_id) if record.user_id else None
-        hf_token = (
-            user.hf_token if user and user.hf_token else os.getenv("HF_TOKEN", "")
+        hf_token = hf_token_for(user)
+        record.pipeline = pipeline_signature(hf_token)
+        # An identical upload may have finished while this one was queued.
+        existing = (
+            find_transcript(db, record.content_hash, record.pipeline) if record.content_hash else None
         )
-        text = _run_whisperx(wav_path, hf_token or None)
-        record.status = "completed"
-        record.result = text
+        if existing and existing.id != record.id:
+            _mark_completed(db, record, existing.result)
+            copy_segments(db, existing.id, record.id)
+            db.flush()
+            index_transcript(db, record)
+            set_stage(db, record, "completed")
+            return
+
+        record.status = "processing"
+        set_stage(db, record, "decode")
+        artifacts = ArtifactStore(record.content_hash)
+        with metrics.span("decode"):
+            audio = artifacts.load_audio(AUDIO_KEY, temp_dir)
+            if audio is None:
+                audio = decode_audio(file_path, temp_dir)
+                artifacts.save_audio(AUDIO_KEY, audio)
+        audio_seconds = len(audio) / SAMPLE_RATE
+        done_chunks = {
+            chunk.chunk_index: {
+                "start": chunk.start_sample,
+                "end": chunk.end_sample,
+                "language": chunk.language,
+                "segments": json.loads(chunk.segments or "[]"),
+            }
+            for chunk in db.query(TranscriptChunk).filter_by(transcript_id=record.id)
+        }
+
+        def save_chunk(index: int, total: int, start: int, chunk: dict) -> None:
+            db.query(TranscriptChunk).filter_by(transcript_id=record.id, chunk_index=index).delete()
+            db.add(
+                TranscriptChunk(
+                    transcript_id=record.id,
+                    chunk_index=index,
+                    start_sample=chunk["start"],
+                    end_sample=chunk["end"],
+                    language=chunk["language"],
+                    segments=json.dumps(chunk["segments"]),
+                )
+            )
+            done = db.query(TranscriptChunk).filter_by(transcript_id=record.id).count()
+            lo, hi = STAGE_PROGRESS["asr"], STAGE_PROGRESS["align"]
+            set_stage(db, record, "asr", lo + int((hi - lo) * done / total))
+
+        segments = _run_whisperx(
+            audio,
+            hf_token,
+            done_chunks,
+            save_chunk,
+            lambda stage: set_stage(db, record, stage),
+            metrics=metrics,
+            artifacts=artifacts,
+            check=lambda: raise_if_cancelled(record.id),
+        )
+        with metrics.span("format"):
+            result = format_text(segments)
+        raise_if_cancelled(record.id)
+        with metrics.span("persist"):
+            _mark_completed(db, record, result)
+            save_segments(db, record.id, segments)
+            db.query(TranscriptChunk).filter_by(transcript_id=record.id).delete()
+            db.flush()
+            index_transcript(db, record)
+            db.commit()
+        record.metrics = json.dumps(metrics.finish(audio_seconds, wait))
+        set_stage(db, record, "completed")
+    except JobCancelled:
+        logger.info("Transcription of %s cancelled", record.id)
+        db.rollback()
+        # cancel_transcription already set the status; drop what this run saved.
+        db.query(TranscriptChunk).filter_by(transcript_id=record.id).delete()
         db.commit()
     except Exception as exc:
         logger.exception("Transcription failed")
+        db.rollback()
         record.status = "failed"
         record.result = str(exc)
+        record.metrics = json.dumps(metrics.finish(audio_seconds, wait))
         db.commit()
+        publish_progress(record.id, record.user_id, status="failed", stage=record.stage)
     finally:
         shutil.rmtree(temp_dir, ignore_errors=True)
         db.close()
 
 
+def transcribe_recording_chunk(record_id: int, chunk_id: int) -> None:
+    """Transcribe one live-recording chunk and append it to the growing transcript."""
+    db = SessionLocal()
+    chunk = db.get(RecordingChunk, chunk_id)
+    record = db.get(Transcript, record_id)
+    if not chunk or not record:
+        db.close()
+        return
+
+    chunk.status = "processing"
+    db.commit()
+    metrics = JobMetrics(LIVE_QUEUE)
+    try:
+        with metrics.span("decode"):
+            audio = decode_audio(chunk.path)
+        chunk.duration = len(audio) / SAMPLE_RATE
+        if chunk.offset is None:
+            # Without a client timestamp, the chunk starts where the previous one ended.
+            previous = (
+                db.query(RecordingChunk)
+                .filter(RecordingChunk.recording_id == chunk.recording_id, RecordingChunk.seq < chunk.seq)
+                .order_by(RecordingChunk.seq.desc())
+                .first()
+            )
+            if previous and previous.offset is not None and previous.duration is not None:
+                chunk.offset = previous.offset + previous.duration
+            else:
+                chunk.offset = 0.0
+        # Chunks are short, so this always takes the single-pass path with
+        # resident models. Speaker labels would not be consistent across
+        # chunks, so live recordings are not diarized.
+        segments = _run_whisperx(audio, metrics=metrics) if len(audio) else []
+        raise_if_cancelled(record.id)
+        with metrics.span("persist"):
+            append_segments(db, record.id, segments, chunk.offset)
+            chunk.status = "completed"
+            db.flush()
+            record.result = format_text(load_segments(db, record.id))
+            db.commit()
+        publish_progress(record.id, record.user_id, status=record.status, stage="asr", progress=record.progress)
+    except JobCancelled:
+        db.rollback()
+        chunk.status = "cancelled"
+        db.commit()
+    except Exception:
+        logger.exception("Transcription of recording chunk %s failed", chunk_id)
+        db.rollback()
+        chunk.status = "failed"
+        db.commit()
+    finally:
+        metrics.finish(chunk.duration)
+        finish_recording_if_done(db, chunk.recording_id)
+        db.close()
+
+
+class _SummaryCheckpoint:
+    """Persists map-reduce partial summaries so a retried job skips finished chunks."""
+
+    def __init__(self, transcript_id: int) -> None:
+        self.transcript_id = transcript_id
+
+    def get(self, key: str) -> str | None:
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(SummaryChunk.summary)
+                .filter_by(transcript_id=self.transcript_id, key=key)
+                .first()
+            )
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    def put(self, key: str, value: str) -> None:
+        db = SessionLocal()
+        try:
+            db.add(SummaryChunk(transcript_id=self.transcript_id, key=key, summary=value))
+            db.commit()
+        finally:
+            db.close()
+
+    def clear(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(SummaryChunk).filter_by(transcript_id=self.transcript_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+
+class _SummaryWriter:
+    """Pushes streamed summary text to subscribers and saves it in throttled batches."""
+
+    def __init__(self, db, record: Transcript) -> None:
+        self.db = db
+        self.record = record
+        # Read once; the record's attributes expire on every commit.
+        self.record_id = record.id
+        self.user_id = record.user_id
+        self.parts: list[str] = []
+        self.last_flush = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def __call__(self, delta: str) -> None:
+        self.parts.append(delta)
+        publish_progress(
+            self.record_id,
+            self.user_id,
+            status="completed",
+            stage="summarize",
+            summary_status="processing",
+            summary_delta=delta,
+        )
+        if time.monotonic() - self.last_flush >= SUMMARY_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        self.record.summary = self.text
+        self.db.commit()
+        self.last_flush = time.monotonic()
+
+
 def summarize_record(record_id: int, mode: str) -> None:
     db = SessionLocal()
     record = db.get(Transcript, record_id)
@@ -100,7 +527,11 @@ def summarize_record(record_id: int, mode: str) -> None:
     record.summary_status = "processing"
     record.summary_mode = mode
     db.commit()
+    publish_progress(
+        record.id, record.user_id, status=record.status, stage="summarize", summary_status="processing"
+    )
 
+    writer = None
     try:
         text = record.result
         user = db.get(User, record.user_id) if record.user_id else None
@@ -109,20 +540,37 @@ def summarize_record(record_id: int, mode: str) -> None:
         )
         ollama_url = user.ollama_url if user and user.ollama_url else os.getenv("OLLAMA_URL")
         ollama_model = user.ollama_model if user and user.ollama_model else os.getenv("OLLAMA_MODEL")
-        summary = summarize(
-            text,
-            mode,
-            openai_api_key=openai_token,
-            ollama_url=ollama_url,
-            ollama_model=ollama_model,
+        checkpoint = _SummaryCheckpoint(record.id)
+        writer = _SummaryWriter(db, record) if SUMMARY_STREAM else None
+        engine, model = engine_and_model(ollama_model)
+        summary = summary_cache.get_or_compute(
+            summary_cache.cache_key(text, mode, engine, model),
+            lambda: summarize(
+                text,
+                mode,
+                openai_api_key=openai_token,
+                ollama_url=ollama_url,
+                ollama_model=ollama_model,
+                checkpoint=checkpoint,
+                on_delta=writer,
+            ),
         )
         record.summary_status = "completed"
         record.summary = summary
+        index_summary(db, record)
         db.commit()
+        checkpoint.clear()
     except Exception as exc:
         logger.exception("Summarization failed")
+        db.rollback()
+        partial = writer.text if writer else ""
         record.summary_status = "failed"
-        record.summary = str(exc)
+        # Keep whatever was streamed before the failure.
+        record.summary = f"{partial}\n\n[Summary interrupted: {exc}]" if partial else str(exc)
         db.commit()
     finally:
+        if record.summary_status != "processing":
+            publish_progress(
+                record.id, record.user_id, status=record.status, summary_status=record.summary_status
+            )
         db.close()
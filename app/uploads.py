@@ -0,0 +1,251 @@
+"""Resumable chunked uploads.
+
+A client creates an upload with the file's name and size, then PUTs
+fixed-size chunks in any order and in parallel, each with its SHA-256.
+Chunks are written at their offset in a preallocated partial file and
+recorded once verified, so an interrupted upload continues with the
+chunks still missing. Completing the upload only marks it complete; the
+worker hashes the file and moves it into the content-addressed store, so
+no web request reads the whole file.
+
+For containers that can be read front to back, a decode job on its own
+queue follows the contiguous prefix received so far, so decoding overlaps
+the upload without holding a transcription worker.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, Transcript, Upload, UploadChunk
+from .jobs import JobCancelled
+from .storage import UPLOAD_DIR, hash_file, store_file
+
+logger = logging.getLogger(__name__)
+
+PARTS_DIR = os.path.join(UPLOAD_DIR, "uploads")
+CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+MAX_BYTES = int(os.getenv("UPLOAD_MAX_GB", "20")) * 1024**3
+# Unfinished uploads are discarded after this long.
+EXPIRE_HOURS = int(os.getenv("UPLOAD_EXPIRE_HOURS", "24"))
+# A worker following an upload gives up when no chunk arrives for this long.
+STALL_SECONDS = int(os.getenv("UPLOAD_STALL_SECONDS", "300"))
+POLL_SECONDS = 1.0
+# Formats ffmpeg can decode from a pipe. MP4/MOV-style files often keep
+# their index at the end, so they are only decoded once complete.
+STREAMABLE = (".wav", ".mp3", ".mkv", ".webm", ".ogg", ".opus", ".flac", ".aac", ".ts")
+_WRITE_BYTES = 1024 * 1024
+
+
+def is_streamable(filename: str) -> bool:
+    return filename.lower().endswith(STREAMABLE)
+
+
+def create_upload(db: Session, user_id: int | None, filename: str, size: int, priority: int = 1) -> Upload:
+    """Create the transcript and partial file for a new upload. The caller commits."""
+    record = Transcript(filename=filename, user_id=user_id)
+    db.add(record)
+    db.flush()
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    upload = Upload(
+        user_id=user_id,
+        transcript_id=record.id,
+        filename=filename,
+        size=size,
+        chunk_size=CHUNK_BYTES,
+        priority=priority,
+        path="",
+    )
+    db.add(upload)
+    db.flush()
+    upload.path = os.path.join(PARTS_DIR, f"{upload.id}.part")
+    # Sparse on most filesystems; chunks are written into place as they arrive.
+    with open(upload.path, "wb") as fh:
+        fh.truncate(size)
+    return upload
+
+
+def chunk_count(upload: Upload) -> int:
+    return max(1, -(-upload.size // upload.chunk_size))
+
+
+def chunk_length(upload: Upload, seq: int) -> int:
+    return min(upload.chunk_size, upload.size - seq * upload.chunk_size)
+
+
+def received(db: Session, upload_id: int, after: int = -1) -> list[int]:
+    """Sequence numbers of the verified chunks of an upload, in order."""
+    rows = (
+        db.query(UploadChunk.seq)
+        .filter(UploadChunk.upload_id == upload_id, UploadChunk.seq > after)
+        .order_by(UploadChunk.seq)
+    )
+    return [row.seq for row in rows]
+
+
+def _write(fd: int, data: bytes, offset: int, digest) -> None:
+    digest.update(data)
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+async def write_chunk(upload: Upload, seq: int, body: AsyncIterator[bytes]) -> tuple[int, str]:
+    """Write one chunk from ``body`` at its offset; returns ``(bytes received, SHA-256)``.
+
+    The request body is gathered into blocks that are hashed and written
+    in a thread, so the event loop never waits on the disk.
+    """
+    limit = chunk_length(upload, seq)
+    offset = seq * upload.chunk_size
+    digest = hashlib.sha256()
+    fd = await asyncio.to_thread(os.open, upload.path, os.O_WRONLY)
+    total = 0
+    block = bytearray()
+    try:
+        async for piece in body:
+            total += len(piece)
+            if total > limit:
+                break
+            block += piece
+            if len(block) >= _WRITE_BYTES:
+                await asyncio.to_thread(_write, fd, bytes(block), offset, digest)
+                offset += len(block)
+                block.clear()
+        if block and total <= limit:
+            await asyncio.to_thread(_write, fd, bytes(block), offset, digest)
+    finally:
+        await asyncio.to_thread(os.close, fd)
+    return total, digest.hexdigest()
+
+
+def record_chunk(db: Session, upload_id: int, seq: int, sha256: str) -> None:
+    """Mark a written chunk as received; sending a chunk again replaces it."""
+    chunk = db.query(UploadChunk).filter_by(upload_id=upload_id, seq=seq).first()
+    if chunk:
+        chunk.sha256 = sha256
+        db.commit()
+        return
+    db.add(UploadChunk(upload_id=upload_id, seq=seq, sha256=sha256))
+    try:
+        db.commit()
+    except IntegrityError:
+        # The same chunk arrived twice at once; either copy is as good.
+        db.rollback()
+
+
+def discard_chunk(db: Session, upload_id: int, seq: int) -> None:
+    """Forget a chunk whose bytes failed verification, in case it was received before."""
+    db.query(UploadChunk).filter_by(upload_id=upload_id, seq=seq).delete()
+    db.commit()
+
+
+def complete_upload(db: Session, upload: Upload) -> None:
+    """Mark a fully received upload complete. Commits; ``store`` does the heavy part."""
+    upload.status = "complete"
+    upload.completed_at = datetime.utcnow()
+    db.commit()
+
+
+def store(db: Session, upload: Upload, content_hash: str | None = None) -> str:
+    """Move a complete upload into the store and return the media path. Commits.
+
+    Runs in the worker. ``content_hash`` may be passed when the file was
+    already hashed while being read; otherwise it is hashed here.
+    """
+    if upload.status == "stored":
+        return upload.path
+    content_hash = content_hash or hash_file(upload.path)
+    path = store_file(upload.path, content_hash)
+    upload.path = path
+    upload.status = "stored"
+    record = db.get(Transcript, upload.transcript_id)
+    if record:
+        record.content_hash = content_hash
+    db.commit()
+    return path
+
+
+def expire_uploads(db: Session) -> None:
+    """Discard uploads left unfinished for longer than ``EXPIRE_HOURS``."""
+    cutoff = datetime.utcnow() - timedelta(hours=EXPIRE_HOURS)
+    stale = db.query(Upload).filter(Upload.status == "uploading", Upload.created_at < cutoff).all()
+    for upload in stale:
+        upload.status = "expired"
+        record = db.get(Transcript, upload.transcript_id)
+        if record and record.status in ("pending", "processing"):
+            record.status = "failed"
+            record.result = "Upload was not completed"
+        db.query(UploadChunk).filter(UploadChunk.upload_id == upload.id).delete()
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            pass
+    if stale:
+        logger.info("Discarded %d unfinished uploads", len(stale))
+        db.commit()
+
+
+def follow(upload_id: int) -> Iterator[bytes]:
+    """Yield an upload's bytes from the start as its contiguous prefix arrives.
+
+    Ends when the whole file has been read. Raises if the upload is
+    abandoned or no new chunk arrives within ``STALL_SECONDS``.
+    """
+    db = SessionLocal()
+    fh = None
+    try:
+        upload = db.get(Upload, upload_id)
+        size, chunk_size = upload.size, upload.chunk_size
+        count = chunk_count(upload)
+        contiguous = 0  # chunks 0..contiguous-1 are on disk
+        pos = 0
+        last_progress = time.monotonic()
+        while pos < size:
+            upload = db.get(Upload, upload_id)
+            status, path = upload.status, upload.path
+            if status in ("complete", "stored"):
+                contiguous = count
+            elif status == "cancelled":
+                raise JobCancelled(f"Upload {upload_id} was cancelled")
+            elif status != "uploading":
+                raise RuntimeError(f"Upload {upload_id} was {status}")
+            else:
+                for seq in received(db, upload_id, after=contiguous - 1):
+                    if seq != contiguous:
+                        break
+                    contiguous += 1
+            # End the read transaction so the next poll sees new chunks.
+            db.rollback()
+            if fh is None:
+                try:
+                    fh = open(path, "rb")
+                except FileNotFoundError:
+                    # Completed and moved between the query and the open.
+                    time.sleep(POLL_SECONDS)
+                    continue
+            available = min(contiguous * chunk_size, size)
+            if available > pos:
+                last_progress = time.monotonic()
+            while pos < available:
+                block = fh.read(min(_WRITE_BYTES, available - pos))
+                if not block:
+                    raise RuntimeError(f"Upload {upload_id} ended early at byte {pos}")
+                pos += len(block)
+                yield block
+            if pos < size:
+                if time.monotonic() - last_progress > STALL_SECONDS:
+                    raise TimeoutError(f"Upload {upload_id} stalled at byte {pos} of {size}")
+                time.sleep(POLL_SECONDS)
+    finally:
+        if fh:
+            fh.close()
+        db.close()
@@ -0,0 +1,125 @@
+"""Energy-based voice activity detection run once before ASR and diarization.
+
+Long silent stretches are cut out and the remaining speech is packed into a
+shorter array, so the models' work scales with speech rather than file
+length. ``Timeline`` maps timestamps on the packed audio back to the
+original recording.
+"""
+import os
+import logging
+
+import numpy as np
+
+from .audio import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("VAD_ENABLED", "true").lower() in ("1", "true", "yes")
+# Only pauses longer than this are removed; shorter ones stay as natural breaks.
+MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "2"))
+PAD_SECONDS = float(os.getenv("VAD_PAD_SECONDS", "0.3"))
+# Frames this far above the recording's noise floor count as speech.
+THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+# Everything that changes which audio the models see, for keying stage artifacts.
+SETTINGS = {
+    "enabled": ENABLED,
+    "min_silence": MIN_SILENCE_SECONDS,
+    "pad": PAD_SECONDS,
+    "threshold_db": THRESHOLD_DB,
+}
+# Anything quieter than this is silence whatever the noise floor.
+_ABSOLUTE_FLOOR_DB = -60.0
+_FRAME = int(0.03 * SAMPLE_RATE)
+# Silence left between packed regions so words from either side do not run together.
+_GAP = int(0.5 * SAMPLE_RATE)
+
+
+def speech_regions(audio: np.ndarray) -> list[tuple[int, int]]:
+    """Return padded ``(start, end)`` sample ranges that contain speech."""
+    frames = len(audio) // _FRAME
+    if frames == 0:
+        return []
+    energy = np.empty(frames, dtype=np.float32)
+    # Work in blocks so memory-mapped recordings are not pulled into RAM at once.
+    block = _FRAME * 4096
+    for lo in range(0, frames * _FRAME, block):
+        chunk = np.asarray(audio[lo:min(lo + block, frames * _FRAME)]).reshape(-1, _FRAME)
+        energy[lo // _FRAME:lo // _FRAME + len(chunk)] = np.square(chunk).mean(axis=1)
+    db = 10 * np.log10(energy + 1e-12)
+    floor, peak = np.percentile(db, [10, 99])
+    # When the quiet frames are not much quieter than the loud ones (steady noise,
+    # music, wall-to-wall speech) keep nearly everything rather than risk losing words.
+    threshold = max(min(floor + THRESHOLD_DB, peak - 20), _ABSOLUTE_FLOOR_DB)
+    voiced = np.flatnonzero(db > threshold)
+    if not len(voiced):
+        return []
+
+    pad = int(PAD_SECONDS * SAMPLE_RATE)
+    min_gap = int(MIN_SILENCE_SECONDS * SAMPLE_RATE)
+    regions: list[tuple[int, int]] = []
+    # Split the voiced frames wherever the pause between them is long enough.
+    breaks = np.flatnonzero(np.diff(voiced) * _FRAME > min_gap)
+    starts = np.concatenate(([voiced[0]], voiced[breaks + 1]))
+    ends = np.concatenate((voiced[breaks], [voiced[-1]]))
+    for first, last in zip(starts, ends):
+        start = max(0, int(first) * _FRAME - pad)
+        end = min(len(audio), (int(last) + 1) * _FRAME + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+class Timeline:
+    """Maps seconds on packed speech audio back to the original recording."""
+
+    def __init__(self, pieces: list[tuple[int, int, int]]) -> None:
+        # (packed start, original start, length) in samples, in order.
+        self._packed = np.array([p[0] for p in pieces], dtype=np.int64)
+        self._original = np.array([p[1] for p in pieces], dtype=np.int64)
+        self._length = np.array([p[2] for p in pieces], dtype=np.int64)
+
+    def to_original(self, seconds: float) -> float:
+        sample = int(round(seconds * SAMPLE_RATE))
+        i = max(0, int(np.searchsorted(self._packed, sample, side="right")) - 1)
+        # Times inside an inserted gap snap to the end of the preceding region.
+        offset = min(max(sample - self._packed[i], 0), self._length[i])
+        return float(self._original[i] + offset) / SAMPLE_RATE
+
+    def map_segments(self, segments: list[dict]) -> list[dict]:
+        for seg in segments:
+            for item in [seg, *seg.get("words", [])]:
+                for key in ("start", "end"):
+                    if item.get(key) is not None:
+                        item[key] = self.to_original(item[key])
+        return segments
+
+
+def pack_speech(audio: np.ndarray) -> tuple[np.ndarray, Timeline | None]:
+    """Return only the speech in ``audio`` and the mapping back to it.
+
+    The timeline is ``None`` when nothing was removed, in which case ``audio``
+    is returned as is. An empty array means the recording is silent.
+    """
+    if not ENABLED:
+        return audio, None
+    regions = speech_regions(audio)
+    if not regions:
+        logger.info("No speech found in %.1fs of audio", len(audio) / SAMPLE_RATE)
+        return audio[:0], None
+    speech = sum(end - start for start, end in regions)
+    # Packing only pays off when a meaningful share of the file is silence.
+    if len(audio) - speech < max(_GAP * len(regions), 0.05 * len(audio)):
+        return audio, None
+    packed = np.zeros(speech + _GAP * (len(regions) - 1), dtype=np.float32)
+    pieces = []
+    pos = 0
+    for start, end in regions:
+        packed[pos:pos + end - start] = audio[start:end]
+        pieces.append((pos, start, end - start))
+        pos += end - start + _GAP
+    logger.info(
+        "Speech is %.1fs of %.1fs in %d regions", speech / SAMPLE_RATE, len(audio) / SAMPLE_RATE, len(regions)
+    )
+    return packed, Timeline(pieces)
@@ -0,0 +1,95 @@
+"""Worker process that runs transcription and summary jobs.
+
+    python -m app.worker
+
+The web process only enqueues jobs into the database, so it never imports
+WhisperX or torch. Run as many workers as the hardware allows, on this host
+or others sharing the database and ``app/data``.
+"""
+import os
+import signal
+import logging
+import threading
+
+from prometheus_client import start_http_server
+
+from .db import init_db
+from .jobs import WorkerPool, TRANSCRIBE_QUEUE, LIVE_QUEUE, SUMMARIZE_QUEUE, DECODE_QUEUE
+from .models import warm_up
+from .pipeline import abandon_recording_chunk, abandon_summary, abandon_transcription
+from .runtime import PROFILE
+from .search import backfill as backfill_search
+from .transcribe import decode_upload, transcribe_file, transcribe_recording_chunk, summarize_record
+
+logger = logging.getLogger(__name__)
+
+# Stage timings, model loads, queue wait, real-time factor and memory are
+# recorded here, not in the web process, so they are exported from here.
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9101"))
+
+
+def build_pool() -> WorkerPool:
+    return WorkerPool(
+        handlers={
+            TRANSCRIBE_QUEUE: transcribe_file,
+            LIVE_QUEUE: transcribe_recording_chunk,
+            SUMMARIZE_QUEUE: summarize_record,
+            DECODE_QUEUE: decode_upload,
+        },
+        concurrency={
+            TRANSCRIBE_QUEUE: int(os.getenv("TRANSCRIBE_WORKERS", "1")),
+            # One live worker keeps each recording's chunks in arrival order.
+            LIVE_QUEUE: int(os.getenv("LIVE_WORKERS", "1")),
+            SUMMARIZE_QUEUE: int(os.getenv("SUMMARIZE_WORKERS", "2")),
+            # Mostly waiting for chunks to arrive, so cheap to run several.
+            DECODE_QUEUE: int(os.getenv("DECODE_WORKERS", "2")),
+        },
+        abandoned={
+            TRANSCRIBE_QUEUE: abandon_transcription,
+            LIVE_QUEUE: abandon_recording_chunk,
+            SUMMARIZE_QUEUE: abandon_summary,
+        },
+    )
+
+
+def start() -> WorkerPool:
+    """Start the job workers plus the background tasks that belong with them."""
+    pool = build_pool()
+    pool.start()
+    threading.Thread(target=backfill_search, daemon=True).start()
+    if os.getenv("MODEL_WARMUP", "").lower() in ("1", "true", "yes"):
+        languages = [l for l in os.getenv("MODEL_WARMUP_LANGUAGES", "en").split(",") if l]
+        threading.Thread(
+            target=warm_up,
+            kwargs={
+                "size": PROFILE.model_size,
+                "compute_type": PROFILE.compute_type,
+                "threads": PROFILE.threads,
+                "languages": languages,
+                "hf_token": os.getenv("HF_TOKEN") or None,
+            },
+            daemon=True,
+        ).start()
+    return pool
+
+
+def main() -> None:
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    init_db()
+    if METRICS_PORT:
+        try:
+            start_http_server(METRICS_PORT)
+        except OSError:
+            # Another worker on this host already has the port.
+            logger.warning("Metrics port %d is in use; set WORKER_METRICS_PORT per worker", METRICS_PORT)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    pool = start()
+    stopping.wait()
+    logger.info("Stopping workers")
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
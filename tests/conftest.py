@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+import pytest
+
+# The app binds its engine at import time, so point it at a scratch database first.
+_DB_DIR = tempfile.TemporaryDirectory(prefix="4ears-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR.name, 'test.sqlite3')}"
+
+from app import db as app_db  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    app_db.init_db()
+    session = app_db.SessionLocal()
+    yield session
+    session.close()
+    with app_db.engine.begin() as conn:
+        for table in ("jobs", "transcripts", "segments", "recordings", "recording_chunks"):
+            conn.execute(app_db.text(f"DELETE FROM {table}"))
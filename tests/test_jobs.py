@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+from app import jobs
+from app.db import Job, Transcript
+
+
+def _expire_lease(db, job_id):
+    db.query(Job).filter(Job.id == job_id).update(
+        {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+
+
+def test_claim_takes_each_job_once(db):
+    job_id = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, file_path="a.wav")
+    job = jobs.claim(jobs.TRANSCRIBE_QUEUE, "worker-a")
+    assert job.id == job_id
+    assert job.status == "running"
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "worker-b") is None
+
+
+def test_expired_lease_is_reclaimed(db):
+    job_id = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None)
+    jobs.claim(jobs.TRANSCRIBE_QUEUE, "worker-a")
+    _expire_lease(db, job_id)
+    job = jobs.claim(jobs.TRANSCRIBE_QUEUE, "worker-b")
+    assert job.id == job_id
+    assert job.worker_id == "worker-b"
+    assert job.attempts == 2
+    # The first worker lost its lease and can no longer finish the job.
+    assert not jobs.heartbeat(job_id, "worker-a")
+    jobs.finish(job_id, "worker-a")
+    assert jobs.job_status(job_id) == "running"
+
+
+def test_job_is_abandoned_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 1)
+    record = Transcript(filename="a.wav", status="processing")
+    db.add(record)
+    db.commit()
+    job_id = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, record.id, file_path="a.wav")
+    jobs.claim(jobs.TRANSCRIBE_QUEUE, "worker-a")
+    _expire_lease(db, job_id)
+
+    abandoned = []
+    assert jobs.claim(
+        jobs.TRANSCRIBE_QUEUE, "worker-b", lambda *args, **kwargs: abandoned.append((args, kwargs))
+    ) is None
+    assert jobs.job_status(job_id) == "failed"
+    assert abandoned[0][0][0] == record.id
+    assert abandoned[0][1] == {"file_path": "a.wav"}
+
+
+def test_abandoned_transcription_and_summary_are_failed(db):
+    from app.pipeline import abandon_summary, abandon_transcription
+
+    record = Transcript(filename="a.wav", status="processing", summary_status="processing")
+    db.add(record)
+    db.commit()
+    abandon_transcription(record.id, "gave up", file_path="a.wav")
+    abandon_summary(record.id, "gave up", mode="basic_summary")
+    db.expire_all()
+    record = db.get(Transcript, record.id)
+    assert record.status == "failed"
+    assert record.result == "gave up"
+    assert record.summary_status == "failed"
+
+
+def test_higher_priority_class_first(db):
+    bulk = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, priority=jobs.PRIORITY_BULK, cost=10)
+    normal = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, priority=jobs.PRIORITY_NORMAL, cost=1000)
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == normal
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == bulk
+
+
+def test_fair_share_prefers_user_with_less_recent_usage(db):
+    busy = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=1, cost=3000)
+    jobs.claim(jobs.TRANSCRIBE_QUEUE, "w")
+    # User 1 has had 3000 s of media processed; user 2 none, so user 2 goes first
+    # even though user 1's next job is older and shorter.
+    first = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=1, cost=10)
+    second = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=2, cost=100)
+    assert busy != first
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == second
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == first
+
+
+def test_shorter_media_first_among_equals(db):
+    long = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=1, cost=3600)
+    short = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=1, cost=60)
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == short
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == long
+
+
+def test_cancelled_job_is_not_claimed(db):
+    record = Transcript(filename="a.wav")
+    db.add(record)
+    db.commit()
+    jobs.enqueue(jobs.TRANSCRIBE_QUEUE, record.id)
+    assert jobs.cancel(record.id, (jobs.TRANSCRIBE_QUEUE,)) == 1
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w") is None
+
+
+def test_aged_bulk_job_is_still_a_candidate(db, monkeypatch):
+    monkeypatch.setattr(jobs, "_CANDIDATES_PER_USER", 1)
+    old = jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=1, priority=jobs.PRIORITY_BULK, cost=10)
+    db.query(Job).filter(Job.id == old).update(
+        {"created_at": datetime.utcnow() - timedelta(seconds=2 * jobs.AGING_SECONDS + 1)}
+    )
+    db.commit()
+    jobs.enqueue(jobs.TRANSCRIBE_QUEUE, None, user_id=1, priority=jobs.PRIORITY_NORMAL, cost=10)
+    # Two aging steps lift the bulk job above the newer normal one, even when
+    # only one job per user makes the candidate list.
+    assert jobs.claim(jobs.TRANSCRIBE_QUEUE, "w").id == old
@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine, text
+
+from app import db as app_db
+from app.db import MIGRATIONS
+
+
+def _version(engine):
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+
+
+def test_fresh_database_gets_every_migration(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.sqlite3'}")
+    monkeypatch.setattr(app_db, "engine", engine)
+    app_db.init_db()
+    assert _version(engine) == len(MIGRATIONS)
+    # Running again is a no-op.
+    app_db.init_db()
+    assert _version(engine) == len(MIGRATIONS)
+
+
+def test_legacy_database_is_upgraded(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    long_line = "[2.00s - 4.00s] Speaker SPEAKER_01: " + "word " * 200
+    with engine.begin() as conn:
+        # The schema before any migrations existed.
+        conn.execute(
+            text(
+                "CREATE TABLE transcripts (id INTEGER PRIMARY KEY, filename TEXT NOT NULL, "
+                "status TEXT, result TEXT, created_at DATETIME)"
+            )
+        )
+        conn.execute(
+            text("INSERT INTO transcripts (id, filename, status, result) VALUES (1, 'a.wav', 'completed', :r)"),
+            {"r": "[0.00s - 1.50s] hello\n" + long_line},
+        )
+    monkeypatch.setattr(app_db, "engine", engine)
+    app_db.init_db()
+    app_db.init_db()
+    assert _version(engine) == len(MIGRATIONS)
+
+    with engine.begin() as conn:
+        stored = conn.execute(text("SELECT result FROM transcripts WHERE id = 1")).scalar()
+        segments = conn.execute(
+            text("SELECT start, \"end\", speaker, text FROM segments WHERE transcript_id = 1 ORDER BY position")
+        ).all()
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(transcripts)"))}
+    # Long text is compressed in place and still reads back.
+    assert isinstance(stored, bytes)
+    assert app_db.decompress(stored).startswith("[0.00s - 1.50s] hello")
+    # Segments are rebuilt from the stored text, once.
+    assert [(s.start, s.end, s.speaker) for s in segments] == [(0.0, 1.5, None), (2.0, 4.0, "SPEAKER_01")]
+    assert segments[0].text == "hello"
+    assert {"content_hash", "metrics", "media_path", "summary_status"} <= columns
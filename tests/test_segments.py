@@ -0,0 +1,18 @@
+from app.segments import append_segments, load_segments
+
+
+def test_append_segments_shifts_known_word_times(db):
+    words = [
+        {"word": "a", "start": 0.0, "end": 0.5},
+        {"word": "b", "start": 0.5},
+        {"word": "2"},
+    ]
+    append_segments(db, 1, [{"start": 0.0, "end": 1.0, "text": "a b 2", "words": words}], offset=10)
+    db.commit()
+    [segment] = load_segments(db, 1, with_words=True)
+    assert (segment["start"], segment["end"]) == (10.0, 11.0)
+    assert [(w.get("start"), w.get("end")) for w in segment["words"]] == [
+        (10.0, 10.5),
+        (10.5, None),
+        (None, None),
+    ]